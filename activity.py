@@ -1,81 +1,197 @@
-from typing import List
+from typing import Dict, List, Mapping, Optional
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
 from temporalio import activity
+from temporalio.exceptions import ApplicationError
 
-from linebot.v3.messaging import (
-    AsyncMessagingApi,
-    ReplyMessageRequest,
-    TextMessage,
-    QuickReply,
-    QuickReplyItem,
-    MessageAction,
-    AudioMessage,
-)
+from linebot.v3.messaging import AsyncMessagingApi, ReplyMessageResponse
+from linebot.v3.messaging.exceptions import ApiException
 
 from config import logger
+from line_api import LineApiPool, send_reply
+from templates import audio_template, quick_reply_template
+from ratelimit import RateLimitWaitTooLongError, TokenBucket, parse_retry_after
+from metrics import LINE_API_ERRORS, REPLY_HTTP_SECONDS
+from router import QuickReplySet, get_keyword_router
+from params import (
+    MATCH_KEYWORD_ROUTES_ACTIVITY,
+    MatchKeywordRoutesActivityParams,
+    RouteMatch,
+    REPLY_AUDIO_ACTIVITY,
+    REPLY_QUICK_REPLY_ACTIVITY,
+    ReplyAudioActivityParams,
+    ReplyQuickReplyActivityParams,
+)
 
 
 @dataclass
-class ReplyTokenParams:
-    reply_token: str
+class ReplyChannel:
+    line_bot_api: AsyncMessagingApi
+    # LINE rate limits each channel separately, so each gets its own bucket.
+    rate_limiter: Optional[TokenBucket] = None
 
 
-@dataclass
-class ReplyQuickReplyActivityParams(ReplyTokenParams):
-    quote_token: str
-    message: str
-    quick_messages: List[str]
+# Time kept for the request itself when bounding the wait for the rate limiter.
+LIMITER_REQUEST_MARGIN_SECONDS = 1.0
 
 
-@dataclass
-class ReplyAudioActivityParams(ReplyTokenParams):
-    content_url: str
-    duration: int
+class ReplyActivity:
+    """
+    Sends replies for every channel the worker serves. The channel name in the
+    activity input picks the messaging API client and the rate limiter; all
+    clients share the same connection pool.
+    """
 
+    def __init__(
+        self,
+        channels: Mapping[str, ReplyChannel],
+        pool: Optional[LineApiPool] = None,
+    ):
+        self.channels: Dict[str, ReplyChannel] = dict(channels)
+        self.pool = pool
+        # The SDK falls back to a 5 minute timeout when none is given per request.
+        self.request_timeout = pool.timeout if pool is not None else None
 
-class ReplyActivity:
-    def __init__(self, async_messaging_api: AsyncMessagingApi):
-        self.line_bot_api = async_messaging_api
+    def _limiter_budget(self) -> Optional[float]:
+        """
+        How long this attempt may wait for the rate limiter and still finish its
+        request before `start_to_close_timeout`.
+        """
+        info = activity.info()
+        if info.start_to_close_timeout is None:
+            return None
+        deadline = info.started_time + info.start_to_close_timeout
+        remaining = (deadline - datetime.now(timezone.utc)).total_seconds()
+        return max(0.0, remaining - LIMITER_REQUEST_MARGIN_SECONDS)
 
-    @activity.defn(name="ReplyQuickReplyActivity")
-    async def reply_quick_reply(self, input: ReplyQuickReplyActivityParams) -> dict:
-        response = await self.line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=input.reply_token,  # type: ignore
-                messages=[
-                    TextMessage(
-                        quote_token=input.quote_token,  # type: ignore
-                        text=input.message,
-                        quick_reply=QuickReply(  # type: ignore
-                            items=[
-                                QuickReplyItem(
-                                    action=MessageAction(label=text, text=text)
-                                )
-                                for text in input.quick_messages  # type: ignore
-                            ]
-                        ),
-                    )
-                ],  # type: ignore
+    def _pool_stats(self) -> dict:
+        return self.pool.stats() if self.pool is not None else {}
+
+    async def _reply_message(
+        self, channel_name: str, body: dict
+    ) -> tuple[ReplyMessageResponse, float]:
+        """
+        Send a reply after taking a token from the channel's rate limiter. Returns
+        the response and the seconds spent waiting for the limiter.
+        """
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            raise ApplicationError(
+                f"Channel {channel_name!r} is not served by this worker.",
+                type="UnknownChannelError",
+                non_retryable=True,
+            )
+
+        waited = 0.0
+        if channel.rate_limiter is not None:
+            try:
+                waited = await channel.rate_limiter.acquire(
+                    max_wait=self._limiter_budget()
+                )
+            except RateLimitWaitTooLongError as e:
+                # Waiting out the backlog here would time the attempt out and use up
+                # its retries, so retry once a token is expected to be free instead.
+                raise ApplicationError(
+                    "LINE API rate limiter backlog exceeds the activity timeout.",
+                    type="LineRateLimitError",
+                    next_retry_delay=timedelta(seconds=e.wait),
+                ) from e
+
+        try:
+            with REPLY_HTTP_SECONDS.time(activity=activity.info().activity_type):
+                response = await send_reply(
+                    channel.line_bot_api, body, request_timeout=self.request_timeout
+                )
+        except ApiException as e:
+            LINE_API_ERRORS.inc(status=e.status, channel=channel_name)
+            if e.status != 429:
+                raise
+            # `ApiException` is non-retryable in the workflow, so surface rate
+            # limiting as its own retryable error that waits for Retry-After.
+            retry_after = parse_retry_after(
+                e.headers.get("Retry-After") if e.headers else None, default=1.0
             )
+            if channel.rate_limiter is not None:
+                channel.rate_limiter.pause(retry_after)
+            logger.warning(
+                "LINE API rate limit exceeded.",
+                extra={"retry_after": retry_after, "channel": channel_name},
+            )
+            raise ApplicationError(
+                "LINE API rate limit exceeded.",
+                type="LineRateLimitError",
+                next_retry_delay=timedelta(seconds=retry_after),
+            ) from e
+
+        return response, waited
+
+    @activity.defn(name=REPLY_QUICK_REPLY_ACTIVITY)
+    async def reply_quick_reply(self, input: ReplyQuickReplyActivityParams) -> dict:
+        template = quick_reply_template(input.message, tuple(input.quick_messages))
+        response, waited = await self._reply_message(
+            input.channel,
+            template.render(input.reply_token, quote_token=input.quote_token),
         )
         logger.info(
-            "Reply audio message sent successfully.", extra={"response": response}
+            "Reply audio message sent successfully.",
+            extra={
+                "response": response,
+                "pool": self._pool_stats(),
+                "rate_limit_wait": waited,
+            },
         )
         return response.to_dict()
 
-    @activity.defn(name="ReplyAudioActivity")
+    @activity.defn(name=REPLY_AUDIO_ACTIVITY)
     async def reply_audio(self, input: ReplyAudioActivityParams) -> dict:
-        response = await self.line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=input.reply_token,  # type: ignore
-                messages=[
-                    AudioMessage(
-                        original_content_url=input.content_url, duration=input.duration
-                    )
-                ],  # type: ignore
-            )
+        template = audio_template(input.content_url, input.duration)
+        response, waited = await self._reply_message(
+            input.channel, template.render(input.reply_token)
         )
         logger.info(
-            "Reply audio message sent successfully.", extra={"response": response}
+            "Reply audio message sent successfully.",
+            extra={
+                "response": response,
+                "pool": self._pool_stats(),
+                "rate_limit_wait": waited,
+            },
         )
         return response.to_dict()
+
+
+@activity.defn(name=MATCH_KEYWORD_ROUTES_ACTIVITY)
+async def match_keyword_routes(
+    input: MatchKeywordRoutesActivityParams,
+) -> List[Optional[RouteMatch]]:
+    """
+    Match messages against the keyword router installed in this worker. Workflows
+    match through this activity, so the routes they act on are recorded in their
+    history instead of depending on the keyword table of the replaying worker.
+    """
+    try:
+        router = get_keyword_router(input.channel)
+    except RuntimeError as e:
+        raise ApplicationError(
+            str(e), type="KeywordRouterNotInstalledError", non_retryable=True
+        ) from e
+
+    matches: List[Optional[RouteMatch]] = []
+    for message in input.messages:
+        route = router.match(message)
+        if route is None:
+            matches.append(None)
+        elif isinstance(route.reply, QuickReplySet):
+            matches.append(
+                RouteMatch(
+                    route.name, message=route.reply.message, options=list(route.reply.options)
+                )
+            )
+        else:
+            matches.append(
+                RouteMatch(
+                    route.name,
+                    content_url=route.reply.content_url,
+                    duration=route.reply.duration,
+                )
+            )
+    return matches
@@ -0,0 +1,302 @@
+"""
+Offline load test for the webhook ingress and the reply path.
+
+Drives correctly signed, mixed webhook batches against the FastAPI app in-process,
+with an in-process stand-in for the Temporal client and a local mock of the LINE
+Messaging API. Workflows are emulated by routing the message with the keyword
+router and running the reply activity through `ActivityEnvironment`. Nothing
+leaves the machine.
+
+Reports throughput and p50/p95/p99 for ingress latency (request to 202) and
+end-to-end reply latency (request sent to reply received by the mock API).
+
+Usage (from the repository root):
+
+    python -m benchmarks.load_test --requests 2000 --concurrency 50 --events 5
+"""
+
+import os
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark-channel-secret")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import time
+import json
+import random
+import asyncio
+import argparse
+import statistics
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+from aiohttp import web
+from temporalio.common import WorkflowIDReusePolicy
+from temporalio.testing import ActivityEnvironment
+from temporalio.exceptions import WorkflowAlreadyStartedError
+
+from config import config
+from main import app
+from activity import (
+    ReplyActivity,
+    ReplyChannel,
+    ReplyAudioActivityParams,
+    ReplyQuickReplyActivityParams,
+)
+from dedup import EventDedupCache
+from dispatch import WorkflowDispatcher
+from ingest import IngestQueue
+from line_api import LineApiPool
+from router import AudioReply, KeywordRouter, QuickReplySet
+from channels import ChannelRegistry
+from workflow import HandleTextMessageWorkflowParams
+from benchmarks.payloads import mixed_events, sign, webhook_body
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def summary(name: str, samples: List[float]) -> str:
+    if not samples:
+        return f"{name:>10}: no samples"
+    return (
+        f"{name:>10}: n={len(samples)} "
+        f"mean={statistics.mean(samples):.2f}ms "
+        f"p50={percentile(samples, 0.50):.2f}ms "
+        f"p95={percentile(samples, 0.95):.2f}ms "
+        f"p99={percentile(samples, 0.99):.2f}ms"
+    )
+
+
+class MockMessagingApi:
+    """
+    A local stand-in for `POST /v2/bot/message/reply` that answers after `latency`
+    seconds and records when each reply token arrived.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.replied_at: Dict[str, float] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def reply(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        self.replied_at[payload["replyToken"]] = time.perf_counter()
+        return web.json_response({"sentMessages": [{"id": "1", "quoteToken": "q"}]})
+
+    async def start(self) -> None:
+        server = web.Application()
+        server.router.add_post("/v2/bot/message/reply", self.reply)
+        self._runner = web.AppRunner(server, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+@dataclass
+class FakeWorkflowHandle:
+    id: str
+
+
+class FakeTemporalClient:
+    """
+    An in-process stand-in for `temporalio.client.Client.start_workflow`. Each start
+    costs `latency` seconds, an ID that was ever started raises
+    `WorkflowAlreadyStartedError` as with `REJECT_DUPLICATE`, and the workflow
+    itself is emulated in a background task.
+    """
+
+    def __init__(self, latency: float, router: KeywordRouter, activity: ReplyActivity):
+        self.latency = latency
+        self.router = router
+        self.activity = activity
+        self.started: set[str] = set()
+        self.tasks: List[asyncio.Task] = []
+
+    async def start_workflow(
+        self,
+        run,
+        params: HandleTextMessageWorkflowParams,
+        *,
+        id: str,
+        task_queue: str,
+        id_reuse_policy: Optional[WorkflowIDReusePolicy] = None,
+    ):
+        await asyncio.sleep(self.latency)
+        if id in self.started:
+            raise WorkflowAlreadyStartedError(id, "HandleTextMessage")
+        self.started.add(id)
+        self.tasks.append(asyncio.create_task(self._run_workflow(params)))
+        return FakeWorkflowHandle(id=id)
+
+    async def _run_workflow(self, params: HandleTextMessageWorkflowParams) -> None:
+        route = self.router.match(params.message)
+        if route is None:
+            return
+        match route.reply:
+            case QuickReplySet(message=message, options=options):
+                await ActivityEnvironment().run(
+                    self.activity.reply_quick_reply,
+                    ReplyQuickReplyActivityParams(
+                        reply_token=params.reply_token,
+                        quote_token=params.quote_token,
+                        message=message,
+                        quick_messages=list(options),
+                    ),
+                )
+            case AudioReply(content_url=content_url, duration=duration):
+                await ActivityEnvironment().run(
+                    self.activity.reply_audio,
+                    ReplyAudioActivityParams(
+                        reply_token=params.reply_token,
+                        content_url=content_url,
+                        duration=duration,
+                    ),
+                )
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    router = KeywordRouter.from_file(
+        config.keyword_table_path, media_base_url=config.media_base_url
+    )
+
+    mock_api = MockMessagingApi(args.line_latency)
+    await mock_api.start()
+
+    pool = LineApiPool(
+        pool_size=config.line_api_pool_size,
+        keepalive_timeout=config.line_api_keepalive_timeout,
+        timeout=config.line_api_timeout,
+        connect_timeout=config.line_api_connect_timeout,
+    )
+    line_bot_api = await pool.messaging_api(config.line_channel_access_token)
+    line_bot_api.line_base_path = mock_api.url
+    reply_activity = ReplyActivity({"": ReplyChannel(line_bot_api)}, pool=pool)
+    client = FakeTemporalClient(args.temporal_latency, router, reply_activity)
+
+    dispatcher = WorkflowDispatcher(
+        client,  # type: ignore
+        task_queue=config.temporal_task_queue,
+        concurrency=config.dispatch_concurrency,
+        dedup_cache=EventDedupCache(maxsize=10000, ttl=3600),
+    )
+    ingest_queue = None
+    if args.queue:
+        ingest_queue = IngestQueue(
+            dispatcher,
+            maxsize=config.ingest_queue_size,
+            workers=config.ingest_queue_workers,
+            full_policy="block",
+        )
+        ingest_queue.start()
+
+    app.state.dispatcher = dispatcher
+    app.state.ingest_queue = ingest_queue
+    app.state.media_library = None
+    app.state.channels = ChannelRegistry(config.channel_settings(), args.parser)
+
+    # Pre-build every request so body generation and signing are not measured.
+    requests = []
+    for _ in range(args.requests):
+        events = mixed_events(
+            args.events,
+            keyword_ratio=args.keyword_ratio,
+            sources=[f"C{i:032d}" for i in range(args.sources)],
+            rng=rng,
+        )
+        if rng.random() < args.redelivery_ratio and requests:
+            # Resend an earlier batch, as LINE does after a failed delivery.
+            events = json.loads(rng.choice(requests)[0])["events"]
+        body = webhook_body(events)
+        requests.append((body, sign(config.line_channel_secret, body)))
+
+    ingress_ms: List[float] = []
+    sent_at: Dict[str, float] = {}
+    statuses: Dict[int, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+
+        async def drive() -> None:
+            while not queue.empty():
+                body, signature = queue.get_nowait()
+                start = time.perf_counter()
+                for event in json.loads(body)["events"]:
+                    if "replyToken" in event:
+                        sent_at.setdefault(event["replyToken"], start)
+                response = await http.post(
+                    "/callback", content=body, headers={"X-Line-Signature": signature}
+                )
+                ingress_ms.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive() for _ in range(args.concurrency)))
+        ingress_seconds = time.perf_counter() - started
+
+        if ingest_queue is not None:
+            await ingest_queue.close(timeout=60)
+        await asyncio.gather(*client.tasks)
+        total_seconds = time.perf_counter() - started
+
+    await pool.close()
+    await mock_api.stop()
+
+    end_to_end_ms = [
+        (replied_at - sent_at[token]) * 1000
+        for token, replied_at in mock_api.replied_at.items()
+        if token in sent_at
+    ]
+    events_sent = args.requests * args.events
+    print(f"statuses: {statuses}")
+    print(
+        f"ingress: {args.requests / ingress_seconds:.1f} req/s, "
+        f"{events_sent / ingress_seconds:.1f} events/s"
+    )
+    print(f"replies: {len(end_to_end_ms)} in {total_seconds:.2f}s")
+    print(f"dedup: {dispatcher.dedup_cache.stats() if dispatcher.dedup_cache else {}}")
+    print(summary("ingress", ingress_ms))
+    print(summary("end-to-end", end_to_end_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--events", type=int, default=5, help="Events per webhook.")
+    parser.add_argument("--sources", type=int, default=20, help="Distinct chats.")
+    parser.add_argument("--keyword-ratio", type=float, default=0.5)
+    parser.add_argument("--redelivery-ratio", type=float, default=0.02)
+    parser.add_argument(
+        "--temporal-latency",
+        type=float,
+        default=0.005,
+        help="The simulated start_workflow latency in seconds.",
+    )
+    parser.add_argument(
+        "--line-latency",
+        type=float,
+        default=0.02,
+        help="The simulated LINE reply API latency in seconds.",
+    )
+    parser.add_argument("--parser", choices=["fast", "sdk"], default="fast")
+    parser.add_argument("--queue", action="store_true", help="Use the ingest queue.")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+Generators for realistic, correctly signed LINE webhook bodies.
+"""
+
+import hmac
+import json
+import uuid
+import base64
+import random
+import hashlib
+import time
+from typing import List, Optional, Sequence
+
+KEYWORDS = ["pingu", "叫", "noot noot", "驚訝", "生氣", "天婦羅", "甜甜圈", "雞排"]
+CHATTER = ["早安", "哈哈哈", "今天吃什麼", "pingu 叫一下", "ok", "👍"]
+
+
+def sign(channel_secret: str, body: bytes) -> str:
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def _base_event(event_type: str, source_id: str, redelivery: bool) -> dict:
+    return {
+        "type": event_type,
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "group", "groupId": source_id, "userId": "U" + uuid.uuid4().hex},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": redelivery},
+    }
+
+
+def text_event(
+    text: str, source_id: str = "C" + "0" * 32, redelivery: bool = False
+) -> dict:
+    event = _base_event("message", source_id, redelivery)
+    event["replyToken"] = uuid.uuid4().hex
+    event["message"] = {
+        "type": "text",
+        "id": str(random.randint(10**17, 10**18)),
+        "quoteToken": uuid.uuid4().hex,
+        "text": text,
+    }
+    return event
+
+
+def sticker_event(source_id: str = "C" + "0" * 32) -> dict:
+    event = _base_event("message", source_id, False)
+    event["replyToken"] = uuid.uuid4().hex
+    event["message"] = {
+        "type": "sticker",
+        "id": str(random.randint(10**17, 10**18)),
+        "quoteToken": uuid.uuid4().hex,
+        "packageId": "446",
+        "stickerId": "1988",
+        "stickerResourceType": "STATIC",
+    }
+    return event
+
+
+def follow_event(source_id: str = "C" + "0" * 32) -> dict:
+    event = _base_event("follow", source_id, False)
+    event["replyToken"] = uuid.uuid4().hex
+    event["follow"] = {"isUnblocked": False}
+    return event
+
+
+def mixed_events(
+    count: int,
+    keyword_ratio: float = 0.5,
+    text_ratio: float = 0.8,
+    sources: Sequence[str] = ("C" + "0" * 32,),
+    rng: Optional[random.Random] = None,
+) -> List[dict]:
+    """
+    A batch where `text_ratio` of the events are text messages, and `keyword_ratio`
+    of those hit a keyword. The rest are stickers and follow events.
+    """
+    rng = rng or random.Random()
+    events = []
+    for _ in range(count):
+        source_id = rng.choice(sources)
+        if rng.random() < text_ratio:
+            pool = KEYWORDS if rng.random() < keyword_ratio else CHATTER
+            events.append(text_event(rng.choice(pool), source_id))
+        elif rng.random() < 0.5:
+            events.append(sticker_event(source_id))
+        else:
+            events.append(follow_event(source_id))
+    return events
+
+
+def webhook_body(events: List[dict], destination: str = "U" + "f" * 32) -> bytes:
+    return json.dumps(
+        {"destination": destination, "events": events}, ensure_ascii=False
+    ).encode("utf-8")
@@ -0,0 +1,117 @@
+"""
+Compare end-to-end reply latency of regular activities against local activities.
+
+Starts a local Temporal dev server, runs `HandleTextMessageWorkflow` against a fake
+Messaging API that answers after a fixed delay, and reports the latency from
+`start_workflow` to workflow completion for both modes.
+
+Usage (from the repository root):
+
+    python -m benchmarks.reply_latency --iterations 200
+"""
+
+import os
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker as TemporalWorker
+from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi, Configuration
+
+from config import config
+from activity import ReplyActivity, ReplyChannel, match_keyword_routes
+from router import KeywordRouter, install_keyword_router
+from workflow import HandleTextMessageWorkflow, HandleTextMessageWorkflowParams
+from benchmarks.reply_payload import StubResponse
+
+TASK_QUEUE = "BENCHMARK:REPLY_LATENCY"
+
+
+def fake_messaging_api(delay: float) -> AsyncMessagingApi:
+    """
+    A messaging API client whose HTTP layer answers every reply after `delay`.
+    """
+    api = AsyncMessagingApi(AsyncApiClient(Configuration(access_token="benchmark")))
+
+    async def request(method, url, **kwargs) -> StubResponse:
+        await asyncio.sleep(delay)
+        return StubResponse()
+
+    api.api_client.rest_client.request = request  # type: ignore
+    return api
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def measure(env: WorkflowEnvironment, iterations: int, local: bool) -> list[float]:
+    samples: list[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await env.client.execute_workflow(
+            HandleTextMessageWorkflow.run,
+            HandleTextMessageWorkflowParams(
+                reply_token="reply-token",
+                quote_token="quote-token",
+                message="noot",
+                use_local_activities=local,
+            ),
+            id=str(uuid.uuid4()),
+            task_queue=TASK_QUEUE,
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def main(iterations: int, delay: float, keyword_table_path: str) -> None:
+    install_keyword_router(
+        KeywordRouter.from_file(keyword_table_path, media_base_url=config.media_base_url)
+    )
+    reply_activity = ReplyActivity({"": ReplyChannel(fake_messaging_api(delay))})
+
+    async with await WorkflowEnvironment.start_local() as env:
+        async with TemporalWorker(
+            env.client,
+            task_queue=TASK_QUEUE,
+            workflows=[HandleTextMessageWorkflow],
+            activities=[
+                reply_activity.reply_quick_reply,
+                reply_activity.reply_audio,
+                match_keyword_routes,
+            ],
+        ):
+            # Warm up the worker and the sticky cache before measuring.
+            await measure(env, 10, local=False)
+            await measure(env, 10, local=True)
+
+            for name, local in [("activity", False), ("local_activity", True)]:
+                samples = await measure(env, iterations, local)
+                print(
+                    f"{name:>15}: "
+                    f"mean={statistics.mean(samples):.2f}ms "
+                    f"p50={percentile(samples, 0.50):.2f}ms "
+                    f"p95={percentile(samples, 0.95):.2f}ms "
+                    f"p99={percentile(samples, 0.99):.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.02,
+        help="The simulated LINE API latency in seconds.",
+    )
+    parser.add_argument("--keyword-table", default="keywords.json")
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.delay, args.keyword_table))
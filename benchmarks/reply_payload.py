@@ -0,0 +1,144 @@
+"""
+Compare the per-reply CPU cost of building the SDK request models against rendering a prebuilt reply template.
+
+Both paths go through the SDK client up to the HTTP request, which is replaced by a
+stub that serializes the body like the SDK REST client and answers 200 at once, so
+only the client-side work is measured.
+
+Usage (from the repository root):
+
+    python -m benchmarks.reply_payload --number 2000
+"""
+
+import os
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import json
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable
+
+from linebot.v3.messaging import (
+    AsyncApiClient,
+    AsyncMessagingApi,
+    AudioMessage,
+    Configuration,
+    MessageAction,
+    QuickReply,
+    QuickReplyItem,
+    ReplyMessageRequest,
+    TextMessage,
+)
+
+from line_api import send_reply
+from templates import audio_template, quick_reply_template
+
+MESSAGE = "想讓 Pingu 怎麼叫 ?"
+OPTIONS = ("叫", "驚訝", "生氣", "天婦羅", "甜甜圈", "雞排")
+CONTENT_URL = "https://example.com/media/noot_noot.mp3"
+RESPONSE_BODY = b'{"sentMessages": [{"id": "1", "quoteToken": "q"}]}'
+
+
+class StubResponse:
+    status = 200
+    reason = "OK"
+
+    def __init__(self):
+        self.data = RESPONSE_BODY
+
+    def getheaders(self) -> dict:
+        return {"content-type": "application/json"}
+
+    def getheader(self, name: str, default=None):
+        return self.getheaders().get(name, default)
+
+
+async def stub_request(method, url, body=None, **kwargs) -> StubResponse:
+    json.dumps(body)
+    return StubResponse()
+
+
+def quick_reply_models(reply_token: str, quote_token: str) -> ReplyMessageRequest:
+    return ReplyMessageRequest(
+        reply_token=reply_token,  # type: ignore
+        messages=[
+            TextMessage(
+                quote_token=quote_token,  # type: ignore
+                text=MESSAGE,
+                quick_reply=QuickReply(  # type: ignore
+                    items=[
+                        QuickReplyItem(action=MessageAction(label=text, text=text))
+                        for text in OPTIONS  # type: ignore
+                    ]
+                ),
+            )
+        ],  # type: ignore
+    )
+
+
+def audio_models(reply_token: str) -> ReplyMessageRequest:
+    return ReplyMessageRequest(
+        reply_token=reply_token,  # type: ignore
+        messages=[AudioMessage(original_content_url=CONTENT_URL, duration=1000)],  # type: ignore
+    )
+
+
+async def measure(send: Callable[[int], Awaitable[object]], number: int) -> float:
+    """
+    The best mean time per reply in microseconds over five runs.
+    """
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for i in range(number):
+            await send(i)
+        best = min(best, (time.perf_counter() - start) / number * 10**6)
+    return best
+
+
+async def main(number: int) -> None:
+    api = AsyncMessagingApi(AsyncApiClient(Configuration(access_token="benchmark")))
+    api.api_client.rest_client.request = stub_request  # type: ignore
+
+    cases = {
+        "quick_reply": (
+            lambda i: api.reply_message(quick_reply_models(f"r{i}", f"q{i}")),
+            lambda i: send_reply(
+                api,
+                quick_reply_template(MESSAGE, OPTIONS).render(f"r{i}", quote_token=f"q{i}"),
+            ),
+            quick_reply_models("r", "q").to_dict(),
+            quick_reply_template(MESSAGE, OPTIONS).render("r", quote_token="q"),
+        ),
+        "audio": (
+            lambda i: api.reply_message(audio_models(f"r{i}")),
+            lambda i: send_reply(api, audio_template(CONTENT_URL, 1000).render(f"r{i}")),
+            audio_models("r").to_dict(),
+            audio_template(CONTENT_URL, 1000).render("r"),
+        ),
+    }
+    for name, (models, template, expected, rendered) in cases.items():
+        # notificationDisabled defaults to false, so both bodies mean the same reply.
+        expected.pop("notificationDisabled", None)
+        rendered.pop("notificationDisabled", None)
+        assert expected == rendered, (expected, rendered)
+
+        models_us = await measure(models, number)
+        template_us = await measure(template, number)
+        print(
+            f"{name:>11}: models {models_us:.1f}us, template {template_us:.1f}us per reply, "
+            f"speedup {models_us / template_us:.1f}x"
+        )
+
+    await api.api_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.number))
@@ -0,0 +1,50 @@
+"""
+Compare the per-request CPU cost of the fast webhook parser against the SDK parser.
+
+Usage (from the repository root):
+
+    python -m benchmarks.webhook_parse --events 10 --number 2000
+"""
+
+import os
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import random
+import timeit
+import argparse
+
+from webhook import FastWebhookParser, SdkWebhookParser
+from benchmarks.payloads import mixed_events, sign, webhook_body
+
+CHANNEL_SECRET = "benchmark-channel-secret"
+
+
+def main(events: int, number: int) -> None:
+    body = webhook_body(mixed_events(events, rng=random.Random(0)))
+    signature = sign(CHANNEL_SECRET, body)
+
+    parsers = {
+        "sdk": SdkWebhookParser(CHANNEL_SECRET),
+        "fast": FastWebhookParser(CHANNEL_SECRET),
+    }
+    results = {}
+    for name, parser in parsers.items():
+        assert parser.parse(body, signature) == parsers["sdk"].parse(body, signature)
+        seconds = min(
+            timeit.repeat(lambda: parser.parse(body, signature), number=number, repeat=5)
+        )
+        results[name] = seconds / number * 10**6
+        print(f"{name:>5}: {results[name]:.1f}us per request ({events} events)")
+
+    print(f"speedup: {results['sdk'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.events, args.number)
@@ -0,0 +1,156 @@
+"""
+Compare workflow task latency and worker memory across workflow runners.
+
+Starts a local Temporal dev server and runs `HandleTextMessageWorkflow` with each
+runner: the SDK default sandbox, the sandbox with the passthrough modules of
+`worker.workflow_runner`, and no sandbox. Workflow task latency is taken from the
+workflow histories (WorkflowTaskStarted -> WorkflowTaskCompleted), so it covers
+only the worker's work on a task. Each runner is measured in its own process, so
+its resident memory is not shared with the others. The sticky cache is disabled by
+default, which makes every workflow task build its sandbox from scratch.
+
+Usage (from the repository root):
+
+    python -m benchmarks.workflow_task --iterations 200
+"""
+
+import os
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import sys
+import uuid
+import asyncio
+import argparse
+import statistics
+import subprocess
+from temporalio.api.enums.v1 import EventType
+from temporalio.client import WorkflowHandle
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker as TemporalWorker, UnsandboxedWorkflowRunner
+from temporalio.worker.workflow_sandbox import SandboxedWorkflowRunner, SandboxRestrictions
+
+from config import config
+from activity import ReplyActivity, ReplyChannel, match_keyword_routes
+from router import KeywordRouter, install_keyword_router
+from worker import SANDBOX_PASSTHROUGH_MODULES
+from workflow import HandleTextMessageWorkflow, HandleTextMessageWorkflowParams
+from benchmarks.reply_latency import fake_messaging_api, percentile
+
+TASK_QUEUE = "BENCHMARK:WORKFLOW_TASK"
+
+RUNNERS = {
+    "sdk_default": lambda: SandboxedWorkflowRunner(),
+    "passthrough": lambda: SandboxedWorkflowRunner(
+        restrictions=SandboxRestrictions.default.with_passthrough_modules(
+            *SANDBOX_PASSTHROUGH_MODULES
+        )
+    ),
+    "unsandboxed": lambda: UnsandboxedWorkflowRunner(),
+}
+
+
+def rss_mib() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def workflow_task_latencies(handle: WorkflowHandle) -> list[float]:
+    latencies: list[float] = []
+    started = None
+    async for event in handle.fetch_history_events():
+        if event.event_type == EventType.EVENT_TYPE_WORKFLOW_TASK_STARTED:
+            started = event.event_time.ToDatetime()
+        elif event.event_type == EventType.EVENT_TYPE_WORKFLOW_TASK_COMPLETED and started:
+            latencies.append((event.event_time.ToDatetime() - started).total_seconds() * 1000)
+            started = None
+    return latencies
+
+
+async def run_workflows(env: WorkflowEnvironment, iterations: int) -> list[WorkflowHandle]:
+    handles = []
+    for _ in range(iterations):
+        handle = await env.client.start_workflow(
+            HandleTextMessageWorkflow.run,
+            HandleTextMessageWorkflowParams(
+                reply_token="reply-token", quote_token="quote-token", message="noot"
+            ),
+            id=str(uuid.uuid4()),
+            task_queue=TASK_QUEUE,
+        )
+        await handle.result()
+        handles.append(handle)
+    return handles
+
+
+async def measure(runner: str, iterations: int, max_cached_workflows: int) -> None:
+    install_keyword_router(
+        KeywordRouter.from_file(config.keyword_table_path, media_base_url=config.media_base_url)
+    )
+    reply_activity = ReplyActivity({"": ReplyChannel(fake_messaging_api(0.0))})
+    rss_before = rss_mib()
+
+    async with await WorkflowEnvironment.start_local() as env:
+        async with TemporalWorker(
+            env.client,
+            task_queue=TASK_QUEUE,
+            workflows=[HandleTextMessageWorkflow],
+            activities=[
+                reply_activity.reply_quick_reply,
+                reply_activity.reply_audio,
+                match_keyword_routes,
+            ],
+            workflow_runner=RUNNERS[runner](),
+            max_cached_workflows=max_cached_workflows,
+        ):
+            await run_workflows(env, 10)
+            handles = await run_workflows(env, iterations)
+            rss_after = rss_mib()
+
+        samples = [
+            latency
+            for latencies in await asyncio.gather(*map(workflow_task_latencies, handles))
+            for latency in latencies
+        ]
+
+    print(
+        f"{runner:>11}: workflow task "
+        f"mean={statistics.mean(samples):.2f}ms "
+        f"p50={percentile(samples, 0.50):.2f}ms "
+        f"p99={percentile(samples, 0.99):.2f}ms, "
+        f"worker rss={rss_after:.1f}MiB (+{rss_after - rss_before:.1f}MiB)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--runner", choices=["all", *RUNNERS], default="all")
+    parser.add_argument(
+        "--max-cached-workflows",
+        type=int,
+        default=0,
+        help="The worker's sticky cache size. 0 rebuilds the sandbox for every workflow task.",
+    )
+    args = parser.parse_args()
+
+    if args.runner != "all":
+        asyncio.run(measure(args.runner, args.iterations, args.max_cached_workflows))
+    else:
+        for runner in RUNNERS:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.workflow_task",
+                    "--runner",
+                    runner,
+                    "--iterations",
+                    str(args.iterations),
+                    "--max-cached-workflows",
+                    str(args.max_cached_workflows),
+                ],
+                check=True,
+            )
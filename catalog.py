@@ -0,0 +1,304 @@
+import os
+import json
+import stat
+import asyncio
+import hashlib
+import tempfile
+import contextlib
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from config import logger
+
+CATALOG_INDEX_VERSION = 1
+
+# Bitrates in kbit/s by (MPEG-1, layer) and (MPEG-2/2.5, layer).
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by the version bits: 0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1.
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+@dataclass(frozen=True)
+class _FrameHeader:
+    mpeg1: bool
+    layer: int
+    sample_rate: int
+    samples: int
+    length: int
+    mono: bool
+
+
+def _parse_frame_header(data: bytes, offset: int) -> Optional[_FrameHeader]:
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset : offset + 4]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x3
+    layer = 4 - ((b1 >> 1) & 0x3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+
+    return _FrameHeader(
+        mpeg1=mpeg1,
+        layer=layer,
+        sample_rate=sample_rate,
+        samples=samples,
+        length=length,
+        mono=(b3 >> 6) == 3,
+    )
+
+
+def _skip_id3v2(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _vbr_frame_count(data: bytes, offset: int, header: _FrameHeader) -> Optional[int]:
+    """
+    The frame count from a Xing/Info or VBRI header in the first frame, if any.
+    """
+    if header.mpeg1:
+        side_info = 17 if header.mono else 32
+    else:
+        side_info = 9 if header.mono else 17
+    xing = offset + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4 : xing + 8], "big")
+        if flags & 0x1:
+            return int.from_bytes(data[xing + 8 : xing + 12], "big")
+        return None
+
+    vbri = offset + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        return int.from_bytes(data[vbri + 14 : vbri + 18], "big")
+    return None
+
+
+def mp3_duration(data: bytes) -> Optional[int]:
+    """
+    The duration of an MP3 stream in milliseconds, from its frame headers. Uses the
+    Xing/Info/VBRI frame count when the encoder wrote one, otherwise walks every
+    frame header. Returns `None` when no MPEG audio frame is found.
+    """
+    offset = _skip_id3v2(data)
+    # Find the first frame: a sync word followed by another frame where the
+    # header says it ends, so stray 0xFF bytes are not taken for a frame.
+    first = None
+    while offset < len(data) - 4:
+        offset = data.find(b"\xff", offset)
+        if offset == -1:
+            return None
+        first = _parse_frame_header(data, offset)
+        if first is not None and first.length > 0:
+            following = offset + first.length
+            if following >= len(data) or _parse_frame_header(data, following):
+                break
+        first = None
+        offset += 1
+    if first is None:
+        return None
+
+    frames = _vbr_frame_count(data, offset, first)
+    if frames is not None:
+        return round(frames * first.samples * 1000 / first.sample_rate)
+
+    total_seconds = 0.0
+    header: Optional[_FrameHeader] = first
+    while header is not None and header.length > 0:
+        total_seconds += header.samples / header.sample_rate
+        offset += header.length
+        header = _parse_frame_header(data, offset)
+    return round(total_seconds * 1000)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    name: str
+    path: Path
+    stat_result: os.stat_result
+    sha256: str
+    duration: Optional[int]
+
+
+def _hash_and_probe(path: Path) -> Tuple[str, bytes]:
+    with open(path, "rb") as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), data
+
+
+class AudioCatalog:
+    """
+    The files of the media directory with their content hash and, for MP3 files,
+    their duration in milliseconds.
+
+    Results are kept in a small JSON index next to the files. On load, a file whose
+    size and modification time match the index is only stat'ed; it is neither read,
+    hashed nor probed again. Durations are keyed by content hash, so a renamed or
+    copied clip is not probed again either. Startup therefore costs one `stat` per
+    file plus the work for new or changed files.
+    """
+
+    def __init__(
+        self, directory: Union[str, Path], index_path: Optional[Union[str, Path]] = None
+    ):
+        self.directory = Path(directory)
+        self.index_path = (
+            Path(index_path)
+            if index_path is not None
+            else self.directory / ".catalog.json"
+        )
+        self._entries: Dict[str, CatalogEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        return self._entries.get(name)
+
+    def durations(self) -> Dict[str, int]:
+        """
+        The known durations by file name, relative to the media directory.
+        """
+        return {
+            entry.name: entry.duration
+            for entry in self._entries.values()
+            if entry.duration is not None
+        }
+
+    def _read_index(self) -> Tuple[Dict[str, list], Dict[str, Optional[int]]]:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Ignoring unreadable audio catalog index.",
+                extra={"path": str(self.index_path), "error": repr(e)},
+            )
+            return {}, {}
+        if index.get("version") != CATALOG_INDEX_VERSION:
+            return {}, {}
+        return index.get("files", {}), index.get("durations", {})
+
+    def _write_index(
+        self, files: Dict[str, list], durations: Dict[str, Optional[int]]
+    ) -> None:
+        index = {"version": CATALOG_INDEX_VERSION, "files": files, "durations": durations}
+        # Every ingress process loads the catalog at startup, so each writes its
+        # own temporary file; the last `os.replace` wins with a complete index.
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w",
+                encoding="utf-8",
+                dir=self.index_path.parent,
+                prefix=f".{self.index_path.name}.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                json.dump(index, f, separators=(",", ":"), sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+            logger.warning(
+                "Could not write the audio catalog index.",
+                extra={"path": str(self.index_path), "error": repr(e)},
+            )
+
+    def _scan(self) -> Tuple[Dict[str, CatalogEntry], int]:
+        cached_files, cached_durations = self._read_index()
+        files: Dict[str, list] = {}
+        durations: Dict[str, Optional[int]] = {}
+        entries: Dict[str, CatalogEntry] = {}
+        hashed = 0
+
+        paths: List[Path] = sorted(self.directory.rglob("*"))
+        for path in paths:
+            try:
+                stat_result = path.stat()
+            except OSError:
+                # A dangling symlink, or a file removed during the scan.
+                continue
+            if not stat.S_ISREG(stat_result.st_mode) or path.name.startswith("."):
+                continue
+            name = path.relative_to(self.directory).as_posix()
+
+            cached = cached_files.get(name)
+            if cached is not None and cached[:2] == [
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            ]:
+                sha256 = cached[2]
+            else:
+                sha256, data = _hash_and_probe(path)
+                hashed += 1
+                if sha256 not in cached_durations:
+                    cached_durations[sha256] = (
+                        mp3_duration(data) if path.suffix.lower() == ".mp3" else None
+                    )
+
+            duration = cached_durations.get(sha256)
+            files[name] = [stat_result.st_size, stat_result.st_mtime_ns, sha256]
+            durations[sha256] = duration
+            entries[name] = CatalogEntry(
+                name=name,
+                path=path,
+                stat_result=stat_result,
+                sha256=sha256,
+                duration=duration,
+            )
+
+        if files != cached_files or durations != cached_durations:
+            self._write_index(files, durations)
+        return entries, hashed
+
+    async def load(self) -> None:
+        if not self.directory.is_dir():
+            raise ValueError(f"Media directory {str(self.directory)!r} does not exist.")
+        self._entries, hashed = await asyncio.to_thread(self._scan)
+        logger.info(
+            "Audio catalog loaded.",
+            extra={
+                "directory": str(self.directory),
+                "files": len(self._entries),
+                "hashed": hashed,
+            },
+        )
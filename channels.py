@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Sequence
+
+from config import ChannelSettings
+from webhook import (
+    FastWebhookParser,
+    SdkWebhookParser,
+    WebhookParserMode,
+    create_webhook_parser,
+    webhook_destination,
+)
+
+
+class UnknownChannelError(LookupError):
+    pass
+
+
+@dataclass(frozen=True)
+class WebhookChannel:
+    name: str
+    task_queue: str
+    parser: FastWebhookParser | SdkWebhookParser
+
+
+class ChannelRegistry:
+    """
+    The channels this process receives webhooks for, indexed by the bot user ID LINE
+    sends as `destination`. Each channel verifies signatures with its own secret.
+    A single channel without a destination accepts every webhook, which is how the
+    `line_channel_secret` setup keeps working.
+    """
+
+    def __init__(self, channels: Sequence[ChannelSettings], parser_mode: WebhookParserMode):
+        self._by_destination: Dict[str, WebhookChannel] = {}
+        self._default: Optional[WebhookChannel] = None
+        for settings in channels:
+            channel = WebhookChannel(
+                name=settings.name,
+                task_queue=settings.task_queue,  # type: ignore
+                parser=create_webhook_parser(
+                    parser_mode, settings.channel_secret, channel=settings.name
+                ),
+            )
+            if settings.destination is None:
+                self._default = channel
+            else:
+                self._by_destination[settings.destination] = channel
+
+    def __len__(self) -> int:
+        return len(self._by_destination) + (self._default is not None)
+
+    def __iter__(self) -> Iterator[WebhookChannel]:
+        if self._default is not None:
+            yield self._default
+        yield from self._by_destination.values()
+
+    def resolve(self, body: bytes) -> WebhookChannel:
+        if self._default is not None and not self._by_destination:
+            return self._default
+
+        destination = webhook_destination(body)
+        channel = self._by_destination.get(destination) if destination else None
+        if channel is None:
+            raise UnknownChannelError(f"Unknown webhook destination: {destination!r}.")
+        return channel
+
+    def task_queues(self) -> Dict[str, str]:
+        return {channel.name: channel.task_queue for channel in self}
@@ -1,8 +1,12 @@
 import sys
+import queue
+import atexit
 import logging
+import logging.handlers
 import structlog
-from pydantic import Field
-from typing import Optional
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, model_validator
+from typing import Literal, Optional
 from structlog.types import EventDict, Processor
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,6 +21,25 @@ class LoggerConfig(BaseSettings):
 
     level: str = "info"
     format: str = "console"
+    # Format and write log records on a background thread instead of the caller's.
+    queue: bool = False
+    # `orjson` is an optional dependency (the `orjson` extra); without it, the
+    # standard `json` serializer is used.
+    json_serializer: Literal["json", "orjson"] = "json"
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the `QueueListener` thread unformatted. The stock `prepare`
+    formats the message in the calling thread, which is exactly the work we want off
+    the event loop. The structlog context variables (e.g. the request ID) are copied
+    onto the record, because the listener thread cannot see the caller's context.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        for key, value in structlog.contextvars.get_contextvars().items():
+            setattr(record, key, value)
+        return record
 
 
 class LoggerMixin:
@@ -33,6 +56,21 @@ class LoggerMixin:
         event_dict["message"] = event_dict.pop("event")
         return event_dict
 
+    def _add_record_timestamp(_, __, event_dict: EventDict) -> EventDict:
+        """
+        With the queue handler, records are formatted later on the listener thread, so
+        stamp them with the time the record was created rather than the time it was
+        rendered.
+        """
+        record = event_dict.get("_record")
+        created = (
+            datetime.fromtimestamp(record.created, tz=timezone.utc)
+            if record is not None
+            else datetime.now(tz=timezone.utc)
+        )
+        event_dict["timestamp"] = created.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return event_dict
+
     def _drop_color_message_key(_, __, event_dict: EventDict) -> EventDict:
         """
         Uvicorn logs the message a second time in the extra `color_message`, but we don't
@@ -46,7 +84,9 @@ class LoggerMixin:
         if self._logger is None:
             config = LoggerConfig()
 
-            timestamper = structlog.processors.TimeStamper(fmt="iso")
+            timestamper: Processor = structlog.processors.TimeStamper(fmt="iso")
+            if config.queue:
+                timestamper = LoggerMixin._add_record_timestamp
 
             shared_processors: list[Processor] = [
                 structlog.contextvars.merge_contextvars,
@@ -77,8 +117,19 @@ class LoggerMixin:
                 cache_logger_on_first_use=True,
             )
 
+            orjson = None
+            if config.format == "json" and config.json_serializer == "orjson":
+                try:
+                    import orjson
+                except ImportError:
+                    pass
+
             log_renderer: structlog.types.Processor
-            if config.format == "json":
+            if orjson is not None:
+                log_renderer = structlog.processors.JSONRenderer(
+                    serializer=lambda obj, **kwargs: orjson.dumps(obj, **kwargs).decode()
+                )
+            elif config.format == "json":
                 log_renderer = structlog.processors.JSONRenderer()
             else:
                 log_renderer = structlog.dev.ConsoleRenderer()
@@ -95,10 +146,20 @@ class LoggerMixin:
                 ],
             )
 
-            handler = logging.StreamHandler()
+            handler: logging.Handler = logging.StreamHandler()
             # Use OUR `ProcessorFormatter` to format all `logging` entries.
             handler.setFormatter(formatter)
 
+            if config.queue:
+                # The caller only enqueues the record. The structlog processor chain
+                # and the write to stdout run on the listener thread, so a slow
+                # stdout does not stall the event loop.
+                log_queue: queue.SimpleQueue = queue.SimpleQueue()
+                listener = logging.handlers.QueueListener(log_queue, handler)
+                listener.start()
+                atexit.register(listener.stop)
+                handler = ContextQueueHandler(log_queue)
+
             self._logger = logging.getLogger()
             self._logger.addHandler(handler)
             self._logger.setLevel(config.level.upper())
@@ -111,7 +172,7 @@ class LoggerMixin:
                 logging.getLogger(_log).propagate = True
 
             # Since we re-create the access logs ourselves, to add all information
-            # in the structured log (see the `logging_middleware` in main.py), we clear
+            # in the structured log (see the `AccessLogMiddleware` in middleware.py), we clear
             # the handlers and prevent the logs to propagate to a logger higher up in the
             # hierarchy (effectively rendering them silent).
             logging.getLogger("uvicorn.access").handlers.clear()
@@ -138,9 +199,58 @@ class LoggerMixin:
 
             sys.excepthook = handle_exception
 
+            if (
+                config.json_serializer == "orjson"
+                and config.format == "json"
+                and orjson is None
+            ):
+                self._logger.warning(
+                    "orjson is not installed, logging with the json serializer instead. "
+                    "Install the `orjson` extra to use it."
+                )
+
         return self._logger  # type: ignore
 
 
+class ChannelSettings(BaseModel):
+    name: str = Field(
+        description="A short, stable name for the channel. It is stored in workflow inputs."
+    )
+
+    destination: Optional[str] = Field(
+        default=None,
+        description="The user ID of the bot, sent as `destination` in its webhooks. Only the single default channel may leave it unset.",
+    )
+
+    channel_secret: str = Field(description="The secret key for the LINE channel.")
+
+    channel_access_token: str = Field(
+        description="The access token for the LINE channel."
+    )
+
+    keyword_table_path: Optional[str] = Field(
+        default=None,
+        description="The keyword table for this channel. Defaults to `Config.keyword_table_path`.",
+    )
+
+    task_queue: Optional[str] = Field(
+        default=None,
+        description="The Temporal task queue for this channel. Defaults to `Config.temporal_task_queue`.",
+    )
+
+    rate_limit: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="The maximum number of LINE API replies per second for this channel. Defaults to `Config.line_api_rate_limit`.",
+    )
+
+    rate_limit_burst: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The replies allowed in a burst above this channel's rate limit. Defaults to `Config.line_api_rate_limit_burst`.",
+    )
+
+
 class Config(BaseSettings, LoggerMixin):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -148,10 +258,121 @@ class Config(BaseSettings, LoggerMixin):
         extra="ignore",
     )
 
-    line_channel_secret: str = Field(description="The secret key for the LINE channel.")
+    line_channel_secret: Optional[str] = Field(
+        default=None,
+        description="The secret key for the LINE channel. Required unless `channels` is set.",
+    )
+
+    line_channel_access_token: Optional[str] = Field(
+        default=None,
+        description="The access token for the LINE  channel. Required unless `channels` is set.",
+    )
+
+    channels: list[ChannelSettings] = Field(
+        default=[],
+        description="The LINE channels served by this process, as a JSON list. Webhooks are routed by their `destination`. Replaces `line_channel_secret` and `line_channel_access_token`.",
+    )
+
+    role: Literal["combined", "ingress", "worker"] = Field(
+        default="combined",
+        description="The process role: ingress only serves webhooks, worker only runs the Temporal worker, combined does both.",
+    )
 
-    line_channel_access_token: str = Field(
-        description="The access token for the LINE  channel."
+    web_host: str = Field(
+        default="0.0.0.0", description="The address the web server listens on."
+    )
+
+    web_port: int = Field(default=8000, description="The port the web server listens on.")
+
+    web_workers: int = Field(
+        default=1,
+        ge=1,
+        description="The number of ingress processes sharing the web port through SO_REUSEPORT.",
+    )
+
+    ingress_metrics_port: Optional[int] = Field(
+        default=8002,
+        description="With more than one web worker, ingress process i also serves its own /metrics on this port + i, because each process keeps its own metrics and a scrape of the shared web port reaches a random process. Disabled when unset.",
+    )
+
+    worker_metrics_port: Optional[int] = Field(
+        default=8001,
+        description="The port of the /metrics and /ready listener of the headless worker process, which has no web app. Use its /ready as the worker's readiness probe. Disabled when unset.",
+    )
+
+    access_log_skip_paths: list[str] = Field(
+        default=["/health", "/ready", "/metrics"],
+        description="Paths whose successful requests are not access logged.",
+    )
+
+    access_log_sample_rates: dict[str, float] = Field(
+        default={},
+        description='The fraction (0.0 - 1.0) of successful requests to access log per path, e.g. {"/callback": 0.1}.',
+    )
+
+    admin_token: Optional[str] = Field(
+        default=None,
+        description="The bearer token for the /admin endpoints. They are disabled when unset.",
+    )
+
+    profiling_max_seconds: float = Field(
+        default=30.0,
+        gt=0,
+        description="The longest profile /admin/profile takes.",
+    )
+
+    slow_request_threshold: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Keep the per-phase timings of requests slower than this many seconds, for /admin/slow-requests. Disabled when unset.",
+    )
+
+    slow_request_capacity: int = Field(
+        default=100,
+        ge=1,
+        description="The number of slow requests kept; older ones are dropped.",
+    )
+
+    line_api_pool_size: int = Field(
+        default=100,
+        ge=1,
+        description="The maximum number of connections to the LINE Messaging API.",
+    )
+
+    line_api_keepalive_timeout: float = Field(
+        default=60.0,
+        gt=0,
+        description="The number of seconds an idle LINE API connection is kept open.",
+    )
+
+    line_api_timeout: float = Field(
+        default=5.0,
+        gt=0,
+        description="The total timeout in seconds for a LINE API request.",
+    )
+
+    line_api_connect_timeout: float = Field(
+        default=2.0,
+        gt=0,
+        description="The timeout in seconds for opening a LINE API connection.",
+    )
+
+    line_api_warmup_connections: int = Field(
+        default=0,
+        ge=0,
+        description="The number of LINE API connections opened at startup before the worker polls. Set to 0 to disable.",
+    )
+
+    line_api_rate_limit: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="The maximum number of LINE API replies per second for each channel, unless the channel sets `rate_limit`. Unset disables the limiter.",
+    )
+
+    line_api_rate_limit_burst: int = Field(
+        default=100,
+        ge=1,
+        description="The number of LINE API replies allowed in a burst above the rate limit.",
     )
 
     temporal_address: str = Field(
@@ -168,6 +389,229 @@ class Config(BaseSettings, LoggerMixin):
         description="The task queue for the Temporal worker.",
     )
 
+    temporal_worker_max_concurrent_activities: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The maximum number of activities the worker runs at once.",
+    )
+
+    temporal_worker_max_concurrent_local_activities: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The maximum number of local activities the worker runs at once.",
+    )
+
+    temporal_worker_max_concurrent_workflow_tasks: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The maximum number of workflow tasks the worker runs at once.",
+    )
+
+    temporal_worker_max_concurrent_workflow_task_polls: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The maximum number of concurrent workflow task pollers.",
+    )
+
+    temporal_worker_max_concurrent_activity_task_polls: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The maximum number of concurrent activity task pollers.",
+    )
+
+    temporal_worker_max_cached_workflows: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="The number of workflows kept in the sticky cache.",
+    )
+
+    temporal_local_activities: bool = Field(
+        default=False,
+        description="Run LINE reply calls as Temporal local activities instead of regular activities.",
+    )
+
+    coalesce_by_source: bool = Field(
+        default=False,
+        description="Send the text messages of each LINE user, group or room to one long-lived workflow through signal-with-start, instead of starting a workflow per message.",
+    )
+
+    coalesce_window_seconds: float = Field(
+        default=1.0,
+        gt=0,
+        description="How long a burst of messages from one source is collected before it is answered.",
+    )
+
+    coalesce_max_replies_per_window: int = Field(
+        default=3,
+        ge=1,
+        description="The most replies sent for one burst of messages from one source.",
+    )
+
+    coalesce_max_messages_per_run: int = Field(
+        default=500,
+        ge=1,
+        description="The number of messages after which a source's workflow continues as new, to keep its history small.",
+    )
+
+    coalesce_idle_timeout_seconds: float = Field(
+        default=300.0,
+        gt=0,
+        description="How long a source's workflow waits for messages before it completes.",
+    )
+
+    temporal_workflow_sandbox: bool = Field(
+        default=True,
+        description="Run workflows in the Temporal sandbox. Disable only to measure the sandbox overhead; workflow determinism is then no longer checked.",
+    )
+
+    temporal_sandbox_passthrough_modules: list[str] = Field(
+        default=[],
+        description="Additional modules the workflow sandbox imports once and shares with the worker instead of re-importing them for every workflow run.",
+    )
+
+    keyword_table_path: str = Field(
+        default="keywords.json",
+        description="The path to the JSON keyword table used to route text messages.",
+    )
+
+    media_base_url: str = Field(
+        default="https://folio.weii.cloud/files/audio/pingu/",
+        description="The base URL the audio files of the keyword table are resolved against in replies. Point it at /media/ to serve them from the bot.",
+    )
+
+    media_directory: Optional[str] = Field(
+        default=None,
+        description="The directory of audio files served under /media/ and probed for reply durations. Unset disables both.",
+    )
+
+    media_catalog_index_path: Optional[str] = Field(
+        default=None,
+        description="Where the audio catalog caches file hashes and durations. Defaults to .catalog.json in the media directory.",
+    )
+
+    media_cache_max_age: int = Field(
+        default=2592000,
+        ge=0,
+        description="The number of seconds clients and CDNs may cache a served media file.",
+    )
+
+    keyword_match_mode: Literal["exact", "substring"] = Field(
+        default="exact",
+        description="exact only replies when the whole message is a keyword, substring also finds keywords inside longer messages.",
+    )
+
+    keyword_match_priority: Literal["first", "longest", "route"] = Field(
+        default="first",
+        description="In substring mode, which keyword wins: the one that starts first, the longest one, or the one whose route has the highest `priority`.",
+    )
+
+    keyword_max_matches: int = Field(
+        default=8,
+        ge=1,
+        description="In substring mode, the number of keyword occurrences after which a message is no longer scanned.",
+    )
+
+    keyword_max_message_length: int = Field(
+        default=200,
+        ge=1,
+        description="In substring mode, the number of leading characters of a message that are scanned.",
+    )
+
+    webhook_parser: Literal["fast", "sdk"] = Field(
+        default="fast",
+        description="How webhooks are parsed: fast only extracts text message fields, sdk builds and validates the full LINE SDK models.",
+    )
+
+    dispatch_concurrency: int = Field(
+        default=8,
+        ge=1,
+        description="The maximum number of in-flight start_workflow calls. Set to 1 to start workflows one at a time.",
+    )
+
+    dedup_cache_size: int = Field(
+        default=10000,
+        ge=0,
+        description="The number of recently started webhook event IDs remembered to skip redeliveries. Set to 0 to disable.",
+    )
+
+    dedup_cache_ttl: float = Field(
+        default=3600.0,
+        gt=0,
+        description="The number of seconds a webhook event ID is remembered.",
+    )
+
+    ingest_queue_enabled: bool = Field(
+        default=False,
+        description="Acknowledge webhooks as soon as the events are queued and start workflows in the background.",
+    )
+
+    ingest_queue_size: int = Field(
+        default=1000, ge=1, description="The maximum number of queued events."
+    )
+
+    ingest_queue_workers: int = Field(
+        default=4,
+        ge=1,
+        description="The number of background dispatchers draining the queue into Temporal.",
+    )
+
+    ingest_queue_full_policy: Literal["reject", "drop_oldest", "block"] = Field(
+        default="reject",
+        description="What to do with a new webhook batch when the queue is full.",
+    )
+
+    ingest_queue_drain_timeout: float = Field(
+        default=10.0,
+        ge=0,
+        description="The number of seconds to wait for the queue to drain on shutdown.",
+    )
+
+    @model_validator(mode="after")
+    def _check_channels(self) -> "Config":
+        if not self.channels:
+            if self.line_channel_secret is None or self.line_channel_access_token is None:
+                raise ValueError(
+                    "Set line_channel_secret and line_channel_access_token, or channels."
+                )
+            return self
+
+        names = [channel.name for channel in self.channels]
+        destinations = [channel.destination for channel in self.channels]
+        if len(set(names)) != len(names):
+            raise ValueError("Channel names must be unique.")
+        if len(self.channels) > 1 and None in destinations:
+            raise ValueError("Every channel needs a destination when several are set.")
+        if len(set(destinations)) != len(destinations):
+            raise ValueError("Channel destinations must be unique.")
+        return self
+
+    def channel_settings(self) -> list[ChannelSettings]:
+        """
+        The configured channels, or the single default channel made from
+        `line_channel_secret` and `line_channel_access_token`, with the per-channel
+        defaults filled in.
+        """
+        channels = self.channels or [
+            ChannelSettings(
+                name="",
+                channel_secret=self.line_channel_secret,  # type: ignore
+                channel_access_token=self.line_channel_access_token,  # type: ignore
+            )
+        ]
+        return [
+            channel.model_copy(
+                update={
+                    "keyword_table_path": channel.keyword_table_path
+                    or self.keyword_table_path,
+                    "task_queue": channel.task_queue or self.temporal_task_queue,
+                    "rate_limit": channel.rate_limit or self.line_api_rate_limit,
+                    "rate_limit_burst": channel.rate_limit_burst
+                    or self.line_api_rate_limit_burst,
+                }
+            )
+            for channel in channels
+        ]
+
 
 config = Config()  # type: ignore
 logger = config.logger
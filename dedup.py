@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+
+
+class EventDedupCache:
+    """
+    A bounded LRU cache of recently started webhook event IDs with a TTL. It lets
+    the ingress path drop LINE redeliveries before they cost a Temporal round-trip.
+    Entries are evicted when they were not added or looked up for `ttl` seconds, or
+    when the cache holds more than `maxsize` entries.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, float] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, event_id: str) -> bool:
+        expires_at = self._entries.get(event_id)
+        if expires_at is None:
+            self.misses += 1
+            return False
+        now = time.monotonic()
+        if expires_at < now:
+            del self._entries[event_id]
+            self.expirations += 1
+            self.misses += 1
+            return False
+        # Moving a hit to the end also refreshes its expiry, so the entries stay
+        # ordered by expiry and `add` can prune from the front.
+        self._entries[event_id] = now + self.ttl
+        self._entries.move_to_end(event_id)
+        self.hits += 1
+        return True
+
+    def add(self, event_id: str) -> None:
+        now = time.monotonic()
+        # The least recently used entries expire first, so expired entries can be
+        # pruned from the front without scanning the whole cache.
+        while self._entries:
+            oldest_id, expires_at = next(iter(self._entries.items()))
+            if expires_at >= now:
+                break
+            del self._entries[oldest_id]
+            self.expirations += 1
+
+        self._entries[event_id] = now + self.ttl
+        self._entries.move_to_end(event_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,193 @@
+import time
+import asyncio
+from typing import List, Mapping, Optional, Sequence
+from dataclasses import dataclass
+from temporalio.client import Client as TemporalClient, WorkflowHandle
+from temporalio.common import WorkflowIDReusePolicy
+from temporalio.exceptions import WorkflowAlreadyStartedError
+
+from config import logger
+from dedup import EventDedupCache
+from metrics import START_WORKFLOW_SECONDS
+from profiling import record_phase
+from workflow import (
+    CoalesceOptions,
+    CoalesceTextMessagesWorkflow,
+    CoalesceTextMessagesWorkflowParams,
+    HandleTextMessageWorkflow,
+    HandleTextMessageWorkflowParams,
+    SourceTextMessage,
+)
+
+
+@dataclass
+class TextMessageEvent:
+    webhook_event_id: str
+    reply_token: str
+    quote_token: str
+    text: str
+    is_redelivery: bool = False
+    channel: str = ""
+    # The user, group or room ID the message was sent in.
+    source: str = ""
+
+    def to_workflow_params(
+        self, use_local_activities: bool = False
+    ) -> HandleTextMessageWorkflowParams:
+        return HandleTextMessageWorkflowParams(
+            reply_token=self.reply_token,
+            quote_token=self.quote_token,
+            message=self.text,
+            use_local_activities=use_local_activities,
+            channel=self.channel,
+        )
+
+    def to_source_message(self) -> SourceTextMessage:
+        return SourceTextMessage(
+            webhook_event_id=self.webhook_event_id,
+            reply_token=self.reply_token,
+            quote_token=self.quote_token,
+            message=self.text,
+        )
+
+
+@dataclass
+class DispatchResult:
+    webhook_event_id: str
+    error: Optional[BaseException] = None
+    duplicate: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class WorkflowDispatcher:
+    """
+    Starts one `HandleTextMessageWorkflow` per text message event. The webhook event ID
+    is used as the workflow ID. The semaphore is shared across requests, so
+    `concurrency` caps the number of in-flight `start_workflow` calls for the whole
+    process, not just for a single webhook batch. Events of a channel listed in
+    `channel_task_queues` are started on that channel's task queue.
+
+    With `coalesce`, events that carry a source are instead sent as signals to the
+    `CoalesceTextMessagesWorkflow` of their source, which is started if it is not
+    running (signal-with-start).
+    """
+
+    def __init__(
+        self,
+        client: TemporalClient,
+        task_queue: str,
+        concurrency: int,
+        use_local_activities: bool = False,
+        dedup_cache: Optional[EventDedupCache] = None,
+        channel_task_queues: Mapping[str, str] = {},
+        coalesce: Optional[CoalesceOptions] = None,
+    ):
+        self.client = client
+        self.task_queue = task_queue
+        self.channel_task_queues = dict(channel_task_queues)
+        self.use_local_activities = use_local_activities
+        self.dedup_cache = dedup_cache
+        self.coalesce = coalesce
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def start(self, event: TextMessageEvent) -> DispatchResult:
+        if self.dedup_cache is not None and event.webhook_event_id in self.dedup_cache:
+            logger.debug(
+                "Skipped duplicate webhook event.",
+                extra={
+                    "workflow_id": event.webhook_event_id,
+                    "is_redelivery": event.is_redelivery,
+                },
+            )
+            return DispatchResult(webhook_event_id=event.webhook_event_id, duplicate=True)
+
+        task_queue = self.channel_task_queues.get(event.channel, self.task_queue)
+        async with self._semaphore:
+            start_time = time.perf_counter()
+            try:
+                if self.coalesce is not None and event.source:
+                    handle = await self._signal_with_start(event, task_queue)
+                else:
+                    handle = await self.client.start_workflow(
+                        HandleTextMessageWorkflow.run,
+                        event.to_workflow_params(self.use_local_activities),
+                        id=event.webhook_event_id,
+                        task_queue=task_queue,
+                        # The workflow is done long before LINE redelivers, so the
+                        # ID must stay taken after it closes to catch redeliveries
+                        # the dedup cache missed.
+                        id_reuse_policy=WorkflowIDReusePolicy.REJECT_DUPLICATE,
+                    )
+            except WorkflowAlreadyStartedError:
+                START_WORKFLOW_SECONDS.observe(
+                    time.perf_counter() - start_time, result="already_started"
+                )
+                # A redelivery of an event whose workflow already ran or is running,
+                # for example after this process restarted and lost its cache.
+                logger.info(
+                    "Workflow for handling text message already started.",
+                    extra={
+                        "task_queue": task_queue,
+                        "workflow_id": event.webhook_event_id,
+                        "is_redelivery": event.is_redelivery,
+                    },
+                )
+                self._remember(event)
+                return DispatchResult(
+                    webhook_event_id=event.webhook_event_id, duplicate=True
+                )
+            except Exception as e:
+                START_WORKFLOW_SECONDS.observe(
+                    time.perf_counter() - start_time, result="error"
+                )
+                logger.exception(
+                    "Failed to start workflow for handling text message.",
+                    extra={
+                        "task_queue": task_queue,
+                        "workflow_id": event.webhook_event_id,
+                    },
+                )
+                return DispatchResult(webhook_event_id=event.webhook_event_id, error=e)
+            finally:
+                record_phase("start_workflow", start_time)
+
+        START_WORKFLOW_SECONDS.observe(time.perf_counter() - start_time, result="ok")
+        self._remember(event)
+        logger.info(
+            "Started workflow for handling text message.",
+            extra={"task_queue": task_queue, "workflow_id": handle.id},
+        )
+        return DispatchResult(webhook_event_id=event.webhook_event_id)
+
+    async def _signal_with_start(
+        self, event: TextMessageEvent, task_queue: str
+    ) -> WorkflowHandle:
+        return await self.client.start_workflow(
+            CoalesceTextMessagesWorkflow.run,
+            CoalesceTextMessagesWorkflowParams(
+                channel=event.channel,
+                source=event.source,
+                options=self.coalesce,  # type: ignore
+                use_local_activities=self.use_local_activities,
+            ),
+            id=f"coalesce:{event.channel}:{event.source}",
+            task_queue=task_queue,
+            start_signal="message",
+            start_signal_args=[event.to_source_message()],
+        )
+
+    def _remember(self, event: TextMessageEvent) -> None:
+        if self.dedup_cache is not None:
+            self.dedup_cache.add(event.webhook_event_id)
+
+    async def dispatch(self, events: Sequence[TextMessageEvent]) -> List[DispatchResult]:
+        """
+        Start a workflow for every event concurrently. A failed start is reported in
+        its own `DispatchResult` and does not cancel the other starts.
+        """
+        if len(events) == 1:
+            return [await self.start(events[0])]
+        return list(await asyncio.gather(*(self.start(event) for event in events)))
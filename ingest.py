@@ -0,0 +1,188 @@
+import time
+import asyncio
+from collections import deque
+from typing import Deque, List, Literal, Sequence, Tuple
+
+from config import logger
+from dispatch import TextMessageEvent, WorkflowDispatcher
+
+FullPolicy = Literal["reject", "drop_oldest", "block"]
+
+
+class IngestQueue:
+    """
+    A bounded in-process queue between `/callback` and Temporal. The webhook handler
+    only enqueues verified events and a pool of background dispatchers drains them
+    into `start_workflow`.
+
+    When the queue is full, `full_policy` decides what happens to a new batch:
+      * `reject`: refuse the whole batch, so `/callback` can answer 503 and LINE
+        redelivers it later.
+      * `drop_oldest`: evict the oldest queued events to make room.
+      * `block`: wait for room, pushing the backpressure into the webhook request.
+    """
+
+    def __init__(
+        self,
+        dispatcher: WorkflowDispatcher,
+        maxsize: int,
+        workers: int,
+        full_policy: FullPolicy,
+    ):
+        self.dispatcher = dispatcher
+        self.maxsize = maxsize
+        self.workers = workers
+        self.full_policy = full_policy
+
+        self._items: Deque[Tuple[float, TextMessageEvent]] = deque()
+        self._condition = asyncio.Condition()
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._closed = False
+
+        self.enqueued = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_wait_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    @property
+    def oldest_age_seconds(self) -> float:
+        if not self._items:
+            return 0.0
+        return time.monotonic() - self._items[0][0]
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "in_flight": self._in_flight,
+            "oldest_age_seconds": self.oldest_age_seconds,
+            "last_wait_seconds": self.last_wait_seconds,
+            "enqueued": self.enqueued,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run_dispatcher(), name=f"ingest-dispatcher-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            "Ingestion queue started.",
+            extra={
+                "maxsize": self.maxsize,
+                "workers": self.workers,
+                "full_policy": self.full_policy,
+            },
+        )
+
+    async def put(self, events: Sequence[TextMessageEvent]) -> bool:
+        """
+        Enqueue a batch of events. Returns False if the batch was refused, either
+        because the queue is closed or because it is full under the `reject` policy.
+        """
+        if not events:
+            return True
+
+        async with self._condition:
+            if self._closed:
+                self.rejected += len(events)
+                return False
+
+            match self.full_policy:
+                case "reject":
+                    if len(self._items) + len(events) > self.maxsize:
+                        self.rejected += len(events)
+                        logger.warning(
+                            "Ingestion queue is full, rejected webhook batch.",
+                            extra=self.stats(),
+                        )
+                        return False
+                    self._append(events)
+
+                case "drop_oldest":
+                    if len(events) > self.maxsize:
+                        self.dropped += len(events) - self.maxsize
+                        events = events[-self.maxsize :]
+                    overflow = len(self._items) + len(events) - self.maxsize
+                    if overflow > 0:
+                        for _ in range(overflow):
+                            self._items.popleft()
+                        self.dropped += overflow
+                        logger.warning(
+                            "Ingestion queue is full, dropped oldest events.",
+                            extra={"dropped": overflow, **self.stats()},
+                        )
+                    self._append(events)
+
+                case "block":
+                    for event in events:
+                        await self._condition.wait_for(
+                            lambda: len(self._items) < self.maxsize or self._closed
+                        )
+                        if self._closed:
+                            self.rejected += 1
+                            return False
+                        self._append([event])
+
+        return True
+
+    def _append(self, events: Sequence[TextMessageEvent]) -> None:
+        now = time.monotonic()
+        self._items.extend((now, event) for event in events)
+        self.enqueued += len(events)
+        self._condition.notify_all()
+
+    async def _run_dispatcher(self) -> None:
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: bool(self._items))
+                enqueued_at, event = self._items.popleft()
+                self._in_flight += 1
+                self._condition.notify_all()
+
+            self.last_wait_seconds = time.monotonic() - enqueued_at
+            try:
+                result = await self.dispatcher.start(event)
+                if result.ok:
+                    self.dispatched += 1
+                else:
+                    self.failed += 1
+            finally:
+                async with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    async def close(self, timeout: float) -> None:
+        """
+        Stop accepting events, wait up to `timeout` seconds for the queued and
+        in-flight events to be dispatched, then stop the dispatchers.
+        """
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(
+                        lambda: not self._items and not self._in_flight
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Ingestion queue drain timed out, discarding remaining events.",
+                    extra=self.stats(),
+                )
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info("Ingestion queue drained.", extra=self.stats())
@@ -0,0 +1,106 @@
+import ssl
+import asyncio
+import aiohttp
+from typing import Optional
+
+from linebot.v3.messaging import (
+    AsyncApiClient,
+    AsyncMessagingApi,
+    Configuration,
+    ReplyMessageResponse,
+)
+
+from config import logger
+
+LINE_API_BASE_URL = "https://api.line.me"
+
+
+async def send_reply(
+    api: AsyncMessagingApi,
+    body: dict,
+    request_timeout: Optional[aiohttp.ClientTimeout] = None,
+) -> ReplyMessageResponse:
+    """
+    `AsyncMessagingApi.reply_message` for a body that is already a JSON-ready dict
+    (see `templates.ReplyTemplate`). The public method validates its argument into a
+    `ReplyMessageRequest` twice, and the SDK converts that back into a dict to send
+    it; calling the undecorated function skips all of that. Errors are raised as
+    `ApiException` exactly like `reply_message`.
+    """
+    return await AsyncMessagingApi.reply_message_with_http_info.raw_function(  # type: ignore
+        api,
+        body,
+        _return_http_data_only=True,
+        _request_timeout=request_timeout,
+    )
+
+
+class LineApiPool:
+    """
+    A shared aiohttp connection pool for the LINE Messaging API. The SDK builds its
+    own `ClientSession` per `AsyncApiClient` with only a connection limit, so we
+    swap in a session with our pool size, keep-alive and timeouts instead.
+    """
+
+    def __init__(
+        self,
+        pool_size: int,
+        keepalive_timeout: float,
+        timeout: float,
+        connect_timeout: float,
+    ):
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._connector = aiohttp.TCPConnector(
+            limit=pool_size,
+            keepalive_timeout=keepalive_timeout,
+            ssl=ssl.create_default_context(),
+        )
+        self.session = aiohttp.ClientSession(
+            connector=self._connector, timeout=self.timeout, trust_env=True
+        )
+
+    async def messaging_api(self, access_token: str) -> AsyncMessagingApi:
+        api_client = AsyncApiClient(Configuration(access_token=access_token))
+        # Drop the session the SDK created for this client before it opens anything.
+        await api_client.rest_client.pool_manager.close()
+        api_client.rest_client.pool_manager = self.session
+        return AsyncMessagingApi(api_client)
+
+    async def warm_up(self, connections: int, url: str = LINE_API_BASE_URL) -> int:
+        """
+        Open up to `connections` keep-alive connections to the Messaging API so
+        the first replies do not pay the TCP and TLS handshakes. Returns the
+        number of connections that were opened.
+        """
+        async def open_connection() -> bool:
+            try:
+                async with self.session.head(url) as response:
+                    await response.read()
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    "Failed to warm up LINE API connection.", extra={"error": repr(e)}
+                )
+                return False
+
+        results = await asyncio.gather(*(open_connection() for _ in range(connections)))
+        opened = sum(results)
+        logger.info(
+            "LINE API connection pool warmed up.",
+            extra={"requested": connections, "opened": opened, **self.stats()},
+        )
+        return opened
+
+    def stats(self) -> dict:
+        # aiohttp has no public pool statistics, so read the connector's bookkeeping.
+        acquired = getattr(self._connector, "_acquired", ())
+        idle = getattr(self._connector, "_conns", {})
+        return {
+            "pool_size": self.pool_size,
+            "in_use": len(acquired),
+            "idle": sum(len(conns) for conns in idle.values()),
+        }
+
+    async def close(self) -> None:
+        await self.session.close()
@@ -1,132 +1,198 @@
+from startup import StartupTimer
+
+# Started before the other imports, so the boot report includes them.
+startup_timer = StartupTimer()
+
+import hmac
 import time
-import logging
 import asyncio
-import uvicorn
-import structlog
 from typing import Annotated
-from contextlib import asynccontextmanager
-from asgi_correlation_id.context import correlation_id
+from contextlib import AsyncExitStack, asynccontextmanager
 from asgi_correlation_id import CorrelationIdMiddleware
-from uvicorn.protocols.utils import get_path_with_query_string
-from fastapi import FastAPI, Header, Request, Response, HTTPException, status
+from fastapi import Depends, FastAPI, Header, Query, Request, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from temporalio.client import Client as TemporalClient
-from temporalio.worker import Worker as TemporalWorker
 
-from linebot.v3.messaging import (
-    AsyncApiClient,
-    AsyncMessagingApi,
-    Configuration,
+from config import config, logger
+from dispatch import WorkflowDispatcher
+from workflow import CoalesceOptions
+from dedup import EventDedupCache
+from webhook import InvalidSignatureError, InvalidWebhookBodyError
+from channels import ChannelRegistry, UnknownChannelError
+from ingest import IngestQueue
+from catalog import AudioCatalog
+from media import MediaLibrary
+from serve import serve
+from middleware import AccessLogMiddleware
+from metrics import REGISTRY, STARTUP_PHASE_SECONDS, serve_metrics, temporal_metrics
+from profiling import (
+    ProfilerBusyError,
+    SamplingProfiler,
+    SlowRequestRecorder,
+    record_phase,
 )
 
-from linebot.v3.webhook import WebhookParser
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
-
-from config import config, logger
-from workflow import HandleTextMessageWorkflow, HandleTextMessageWorkflowParams
-from activity import ReplyActivity
+startup_timer.record("imports", startup_timer.elapsed())
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    client = await TemporalClient.connect(
-        config.temporal_address, namespace=config.temporal_namespace
-    )
+    metrics_bridge = temporal_metrics()
+    with startup_timer.phase("temporal_connect"):
+        client = await TemporalClient.connect(
+            config.temporal_address,
+            namespace=config.temporal_namespace,
+            runtime=metrics_bridge.runtime,
+        )
     app.state.temporal_client = client
     logger.debug(
         "Connected to Temporal server.",
         extra={
             "address": config.temporal_address,
             "namespace": config.temporal_namespace,
+            "role": config.role,
         },
     )
 
-    line_bot_api = AsyncMessagingApi(
-        AsyncApiClient(Configuration(access_token=config.line_channel_access_token))
-    )
-
-    reply_activity = ReplyActivity(line_bot_api)
+    async with AsyncExitStack() as stack:
+        metrics_task = asyncio.create_task(metrics_bridge.run(interval=5.0))
+        stack.callback(metrics_task.cancel)
+
+        # Set by `serve` in the processes of multi-process ingress, whose `/metrics`
+        # on the shared web port would answer for a random process.
+        if app.state.metrics_port is not None:
+            metrics_server = await serve_metrics(
+                REGISTRY, config.web_host, app.state.metrics_port
+            )
+            stack.push_async_callback(metrics_server.wait_closed)
+            stack.callback(metrics_server.close)
+            logger.info(
+                "Serving process metrics.",
+                extra={"host": config.web_host, "port": app.state.metrics_port},
+            )
+
+        media_library = None
+        if config.role in ("combined", "ingress") and config.media_directory is not None:
+            media_library = MediaLibrary(
+                AudioCatalog(
+                    config.media_directory,
+                    index_path=config.media_catalog_index_path,
+                ),
+                max_age=config.media_cache_max_age,
+            )
+            with startup_timer.phase("media_catalog"):
+                await media_library.load()
+
+        workers = []
+        if config.role in ("combined", "worker"):
+            # Imported here so ingress-only processes never load the LINE
+            # messaging SDK, which the worker needs for replies.
+            with startup_timer.phase("worker_imports"):
+                from worker import temporal_worker
+            with startup_timer.phase("worker_setup"):
+                # In the combined role, the worker takes its audio durations from
+                # the catalog loaded above instead of scanning the media again.
+                workers = await stack.enter_async_context(
+                    temporal_worker(
+                        client,
+                        audio_catalog=(
+                            media_library.catalog if media_library is not None else None
+                        ),
+                    )
+                )
+
+        dispatcher = None
+        ingest_queue = None
+        channels = None
+        if config.role in ("combined", "ingress"):
+            channels = ChannelRegistry(config.channel_settings(), config.webhook_parser)
+
+            dispatcher = WorkflowDispatcher(
+                client,
+                task_queue=config.temporal_task_queue,
+                concurrency=config.dispatch_concurrency,
+                use_local_activities=config.temporal_local_activities,
+                dedup_cache=(
+                    EventDedupCache(
+                        maxsize=config.dedup_cache_size, ttl=config.dedup_cache_ttl
+                    )
+                    if config.dedup_cache_size > 0
+                    else None
+                ),
+                channel_task_queues=channels.task_queues(),
+                coalesce=(
+                    CoalesceOptions(
+                        window_seconds=config.coalesce_window_seconds,
+                        max_replies_per_window=config.coalesce_max_replies_per_window,
+                        max_messages_per_run=config.coalesce_max_messages_per_run,
+                        idle_timeout_seconds=config.coalesce_idle_timeout_seconds,
+                    )
+                    if config.coalesce_by_source
+                    else None
+                ),
+            )
+
+            if config.ingest_queue_enabled:
+                ingest_queue = IngestQueue(
+                    dispatcher,
+                    maxsize=config.ingest_queue_size,
+                    workers=config.ingest_queue_workers,
+                    full_policy=config.ingest_queue_full_policy,
+                )
+                ingest_queue.start()
+                REGISTRY.add_stats_collector(
+                    "pingu_ingest_queue", "Ingestion queue", ingest_queue.stats
+                )
+
+            if dispatcher.dedup_cache is not None:
+                REGISTRY.add_stats_collector(
+                    "pingu_dedup_cache", "Dedup cache", dispatcher.dedup_cache.stats
+                )
+
+        app.state.dispatcher = dispatcher
+        app.state.channels = channels
+        app.state.ingest_queue = ingest_queue
+        app.state.media_library = media_library
+        app.state.workers = workers
+        app.state.ready = True
+
+        for phase, seconds in startup_timer.phases.items():
+            STARTUP_PHASE_SECONDS.set(seconds, phase=phase)
+        logger.info(
+            "Application startup complete.",
+            extra={"role": config.role, **startup_timer.summary()},
+        )
 
-    worker = TemporalWorker(
-        client,
-        task_queue=config.temporal_task_queue,
-        workflows=[HandleTextMessageWorkflow],
-        activities=[reply_activity.reply_quick_reply, reply_activity.reply_audio],
-    )
+        yield
 
-    task = asyncio.create_task(worker.run())
-    logger.info(
-        "Temporal worker started.", extra={"task_queue": config.temporal_task_queue}
-    )
+        # Take the process out of rotation before it stops accepting work.
+        app.state.ready = False
 
-    yield
+        # Drain the queue before the worker stops, so queued events still get
+        # started while the Temporal client is usable.
+        if ingest_queue is not None:
+            await ingest_queue.close(config.ingest_queue_drain_timeout)
 
-    task.cancel()
-    try:
-        await task
-    except asyncio.CancelledError:
-        await worker.shutdown()
-        logger.info("Application shutdown: Temporal worker shutdown gracefully.")
-        await line_bot_api.api_client.close()
-        config.logger.debug("Application shutdown: LINE API Client closed.")
+        if dispatcher is not None and dispatcher.dedup_cache is not None:
+            logger.info("Dedup cache statistics.", extra=dispatcher.dedup_cache.stats())
 
 
 app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+app.state.ready = False
+app.state.metrics_port = None
+app.state.profiler = SamplingProfiler()
+app.state.slow_requests = (
+    SlowRequestRecorder(config.slow_request_threshold, config.slow_request_capacity)
+    if config.slow_request_threshold is not None
+    else None
+)
 
-access_logger = logging.getLogger("fastapi.access")
-
-
-@app.middleware("http")
-async def logging_middleware(request: Request, call_next) -> Response:
-    structlog.contextvars.clear_contextvars()
-    # These context vars will be added to all log entries emitted during the request
-    request_id = correlation_id.get()
-    structlog.contextvars.bind_contextvars(request_id=request_id)
-
-    start_time = time.perf_counter_ns()
-    # If the call_next raises an error, we still want to return our own 500 response,
-    # so we can add headers to it (process time, request ID...)
-    response = Response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    try:
-        response = await call_next(request)
-    except Exception:
-        # TODO: Validate that we don't swallow exceptions (unit test?)
-        logging.getLogger("fastapi.error").exception("Uncaught exception")
-        raise
-    finally:
-        process_time = time.perf_counter_ns() - start_time
-        status_code = response.status_code
-        url = get_path_with_query_string(request.scope)  # type: ignore
-        client_host = request.client.host  # type: ignore
-        client_port = request.client.port  # type: ignore
-        http_method = request.method
-        http_version = request.scope["http_version"]
-        # Recreate the Uvicorn access log format, but add all parameters as structured information
-        message = f"""{client_host}:{client_port} - "{http_method} {url} HTTP/{http_version}" {status_code} {process_time / 10.0**6}ms"""
-        extra = {
-            "http": {
-                "url": str(request.url),
-                "status_code": status_code,
-                "method": http_method,
-                "request_id": request_id,
-                "version": http_version,
-            },
-            "network": {"client": {"ip": client_host, "port": client_port}},
-            "duration": process_time,
-        }
-
-        match status_code:
-            case code if 400 <= code < 500:
-                access_logger.warning(message, extra=extra)
-            case code if code >= 500:
-                access_logger.error(message, extra=extra)
-            case _:
-                access_logger.info(message, extra=extra)
-
-        # seconds
-        response.headers["X-Process-Time"] = str(process_time / 10.0**9)
-        return response
-
+app.add_middleware(
+    AccessLogMiddleware,
+    skip_paths=config.access_log_skip_paths,
+    sample_rates=config.access_log_sample_rates,
+    slow_requests=app.state.slow_requests,
+)
 
 # This middleware must be placed after the logging, to populate the context with the request ID
 # NOTE: Why last??
@@ -140,45 +206,180 @@ def health():
     return "OK"
 
 
+@app.get("/ready")
+def ready():
+    """
+    Succeeds once `lifespan` has connected to Temporal and set up this role, and,
+    when this process runs the Temporal worker, while every worker is polling. Use
+    it as the readiness probe; `/health` only says the process is up. With several
+    web workers, the Temporal worker runs in a headless process that answers its
+    own `/ready` on `WORKER_METRICS_PORT`.
+    """
+    if not app.state.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Not started."
+        )
+    if not all(worker.is_running for worker in app.state.workers):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Temporal worker is not polling.",
+        )
+    return "OK"
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    The metrics of the process that took the connection. With several web
+    workers, scrape the per-process listeners on `INGRESS_METRICS_PORT` instead.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def require_admin(authorization: Annotated[str | None, Header()] = None) -> None:
+    if config.admin_token is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if authorization is None or not hmac.compare_digest(
+        authorization.encode("utf-8"), f"Bearer {config.admin_token}".encode("utf-8")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.post(
+    "/admin/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_admin)],
+)
+async def admin_profile(
+    seconds: Annotated[float, Query(gt=0)] = 10.0,
+    interval_ms: Annotated[float, Query(ge=1)] = 5.0,
+):
+    """
+    Sample the event loop thread for `seconds` and return the collapsed stacks, e.g.
+    for `flamegraph.pl` or speedscope.
+    """
+    if seconds > config.profiling_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Profiles are limited to {config.profiling_max_seconds} seconds.",
+        )
+
+    profiler: SamplingProfiler = app.state.profiler
+    try:
+        stacks = await profiler.profile(seconds, interval_ms / 1000)
+    except ProfilerBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="A profile is already running."
+        )
+    return PlainTextResponse(stacks)
+
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def admin_slow_requests():
+    slow_requests: SlowRequestRecorder | None = app.state.slow_requests
+    if slow_requests is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Slow request recording is disabled.",
+        )
+    return {
+        "threshold_seconds": slow_requests.threshold,
+        "requests": slow_requests.requests(),
+    }
+
+
+@app.api_route("/media/{name:path}", methods=["GET", "HEAD"])
+async def media(request: Request, name: str):
+    media_library: MediaLibrary | None = app.state.media_library
+    media_file = media_library.get(name) if media_library is not None else None
+    if media_library is None or media_file is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return media_library.response(media_file, request.headers)
+
+
 @app.post("/callback", status_code=status.HTTP_202_ACCEPTED)
 async def handle_callback(request: Request, x_line_signature: Annotated[str, Header()]):
+    start_time = time.perf_counter()
+    try:
+        return await _handle_callback(request, x_line_signature)
+    finally:
+        record_phase("handler", start_time)
+
+
+async def _handle_callback(request: Request, x_line_signature: str) -> str:
+    dispatcher: WorkflowDispatcher | None = app.state.dispatcher
+    if dispatcher is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Webhook ingress is disabled for this role.",
+        )
+
+    channels: ChannelRegistry = app.state.channels
+
+    start_time = time.perf_counter()
     body = await request.body()
+    record_phase("read_body", start_time)
 
+    start_time = time.perf_counter()
     try:
-        events = WebhookParser(config.line_channel_secret).parse(
-            body.decode(), x_line_signature
+        channel = channels.resolve(body)
+    except UnknownChannelError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown webhook destination."
         )
+
+    try:
+        text_events = channel.parser.parse(body, x_line_signature)
     except InvalidSignatureError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature."
         )
-
-    temporal_client: TemporalClient = app.state.temporal_client
-
-    for event in events:  # type: ignore
-        logger.debug("Received webhook event.", extra={"event": event})
-        if not isinstance(event, MessageEvent):
-            continue
-        if not isinstance(event.message, TextMessageContent):
-            continue
-
-        handle = await temporal_client.start_workflow(
-            HandleTextMessageWorkflow.run,
-            HandleTextMessageWorkflowParams(
-                reply_token=event.reply_token,  # type: ignore
-                quote_token=event.message.quote_token,
-                message=event.message.text,
-            ),
-            id=event.webhook_event_id,
-            task_queue=config.temporal_task_queue,
+    except InvalidWebhookBodyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed webhook body."
         )
-        logger.info(
-            "Started workflow for handling text message.",
-            extra={"task_queue": config.temporal_task_queue, "workflow_id": handle.id},
+    finally:
+        record_phase("parse", start_time)
+
+    start_time = time.perf_counter()
+    ingest_queue: IngestQueue | None = app.state.ingest_queue
+    if ingest_queue is not None:
+        accepted = await ingest_queue.put(text_events)
+        record_phase("enqueue", start_time)
+        if not accepted:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Ingestion queue is full.",
+            )
+        return "ACCEPTED"
+
+    results = await dispatcher.dispatch(text_events)
+    record_phase("dispatch", start_time)
+    failed = [result.webhook_event_id for result in results if not result.ok]
+    if failed:
+        # Let LINE redeliver the batch. Events that already started are skipped by
+        # the dedup cache, or count as started when Temporal rejects their
+        # workflow ID, which stays taken after the workflow closed.
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to start workflows for events: {', '.join(failed)}.",
         )
 
     return "ACCEPTED"
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
+    serve(
+        app,
+        host=config.web_host,
+        port=config.web_port,
+        workers=config.web_workers,
+        role=config.role,
+        metrics_port=config.ingress_metrics_port,
+    )
@@ -0,0 +1,69 @@
+from collections import deque
+from typing import Dict, Generic, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class AhoCorasick(Generic[T]):
+    """
+    An Aho-Corasick automaton over a fixed set of patterns. `iter_matches` finds
+    every occurrence of every pattern in one pass over the text, so the scan is
+    linear in the text length plus the number of matches, however many patterns
+    there are. The automaton is immutable once built.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[int, T]]] = [[]]
+        for pattern, value in patterns:
+            if not pattern:
+                raise ValueError("Patterns must not be empty.")
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append((len(pattern), value))
+
+        # Breadth-first, so the fail target of a state is always finished first.
+        # Each state's outputs are extended with those of its fail target, so a
+        # match never has to walk the fail chain.
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                target = fail[state]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                fail[next_state] = goto[target].get(char, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                outputs[next_state].extend(outputs[fail[next_state]])
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs: List[Tuple[Tuple[int, T], ...]] = [tuple(o) for o in outputs]
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, T]]:
+        """
+        Yield `(start, end, value)` for every pattern occurrence, ordered by `end`.
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in outputs[state]:
+                yield i + 1 - length, i + 1, value
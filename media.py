@@ -0,0 +1,83 @@
+import os
+import mimetypes
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+from config import logger
+from catalog import AudioCatalog
+
+
+@dataclass(frozen=True)
+class MediaFile:
+    path: Path
+    stat_result: os.stat_result
+    etag: str
+    media_type: str
+
+
+class MediaLibrary:
+    """
+    The audio clips served by the bot itself. The files are taken from the
+    `AudioCatalog` of the media directory at startup, so requests are answered from
+    memory with a strong, content-based ETag and never touch the file system before
+    the body is sent. Only catalogued files can be served, which also rules out
+    path traversal. Restart (or call `load` again) to pick up new clips.
+    """
+
+    def __init__(self, catalog: AudioCatalog, max_age: int):
+        self.catalog = catalog
+        self.cache_control = f"public, max-age={max_age}"
+        self._files: Dict[str, MediaFile] = {}
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    async def load(self) -> None:
+        await self.catalog.load()
+        self._files = {
+            entry.name: MediaFile(
+                path=entry.path,
+                stat_result=entry.stat_result,
+                etag=f'"{entry.sha256}"',
+                media_type=mimetypes.guess_type(entry.path.name)[0]
+                or "application/octet-stream",
+            )
+            for entry in self.catalog
+        }
+        logger.info(
+            "Media library loaded.",
+            extra={
+                "directory": str(self.catalog.directory),
+                "files": len(self._files),
+                "bytes": sum(f.stat_result.st_size for f in self._files.values()),
+            },
+        )
+
+    def get(self, name: str) -> Optional[MediaFile]:
+        return self._files.get(name)
+
+    def response(self, media_file: MediaFile, request_headers: Headers) -> Response:
+        """
+        A 304 when the client already has this version, otherwise a `FileResponse`.
+        `FileResponse` answers `Range` / `If-Range` requests with 206 and hands the
+        file to the server with `http.response.pathsend` (sendfile) when the server
+        supports that extension.
+        """
+        headers = {"etag": media_file.etag, "cache-control": self.cache_control}
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None and (
+            if_none_match.strip() == "*"
+            or media_file.etag
+            in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+        ):
+            return Response(status_code=304, headers=headers)
+
+        return FileResponse(
+            media_file.path,
+            headers=headers,
+            media_type=media_file.media_type,
+            stat_result=media_file.stat_result,
+        )
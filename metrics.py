@@ -0,0 +1,350 @@
+import math
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+from temporalio.runtime import (
+    BUFFERED_METRIC_KIND_COUNTER,
+    BUFFERED_METRIC_KIND_GAUGE,
+    MetricBuffer,
+    MetricBufferDurationFormat,
+    Runtime,
+    TelemetryConfig,
+)
+
+# A small Prometheus text exposition registry. It covers the counters, gauges and
+# histograms this service needs without adding a client library to the lock file.
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _label_key(labels: Mapping[str, object]) -> LabelKey:
+    if not labels:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(key: LabelKey, extra: LabelKey = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[_label_key(labels)] = value
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: non-cumulative bucket counts, then the sum.
+        self._values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = ([0] * len(self.buckets), [0.0])
+        counts, total = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _get_or_create(self, cls, name: str, documentation: str, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}.")
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)  # type: ignore
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)  # type: ignore
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)  # type: ignore
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """
+        Register a callback that refreshes gauges right before every scrape.
+        """
+        self._collectors.append(collector)
+
+    def add_stats_collector(
+        self,
+        prefix: str,
+        documentation: str,
+        stats: Callable[[], dict],
+        **labels: object,
+    ) -> None:
+        """
+        Export every numeric value of a `stats()` dict as a `{prefix}_{key}` gauge,
+        with `labels` on every sample.
+        """
+
+        def collect() -> None:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.gauge(f"{prefix}_{key}", f"{documentation} ({key})").set(
+                        value, **labels
+                    )
+
+        self.add_collector(collect)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+WEBHOOK_SIGNATURE_SECONDS = REGISTRY.histogram(
+    "pingu_webhook_signature_verification_seconds",
+    "Time spent verifying the webhook signature.",
+)
+WEBHOOK_PARSE_SECONDS = REGISTRY.histogram(
+    "pingu_webhook_parse_seconds",
+    "Time spent parsing a webhook body into text message events.",
+)
+START_WORKFLOW_SECONDS = REGISTRY.histogram(
+    "pingu_temporal_start_workflow_seconds",
+    "Latency of start_workflow calls by result.",
+)
+REPLY_HTTP_SECONDS = REGISTRY.histogram(
+    "pingu_line_reply_http_seconds",
+    "Latency of LINE reply API calls by activity.",
+)
+LINE_API_ERRORS = REGISTRY.counter(
+    "pingu_line_api_errors_total", "LINE API errors by HTTP status."
+)
+STARTUP_PHASE_SECONDS = REGISTRY.gauge(
+    "pingu_startup_phase_seconds", "Time spent in each startup phase of this process."
+)
+
+# Names of the metrics recorded from workflow code through the Temporal metric
+# meter. They reach the registry through `TemporalMetricsBridge`.
+WORKFLOW_KEYWORD_MATCHES = "pingu_keyword_matches"
+WORKFLOW_END_TO_END_SECONDS = "pingu_workflow_end_to_end_seconds"
+
+
+class TemporalMetricsBridge:
+    """
+    Collects the Temporal SDK runtime metrics (and metrics recorded through
+    `workflow.metric_meter()`) in a `MetricBuffer` and folds them into the registry,
+    so they are served from the same `/metrics` endpoint.
+    """
+
+    def __init__(self, registry: Registry, buffer_size: int = 10000):
+        self.registry = registry
+        self.buffer = MetricBuffer(
+            buffer_size, duration_format=MetricBufferDurationFormat.SECONDS
+        )
+        self.runtime = Runtime(telemetry=TelemetryConfig(metrics=self.buffer))
+        registry.add_collector(self.drain)
+
+    def drain(self) -> None:
+        for update in self.buffer.retrieve_updates():
+            metric = update.metric
+            labels = {key: value for key, value in update.attributes.items()}
+            match metric.kind:
+                case kind if kind == BUFFERED_METRIC_KIND_COUNTER:
+                    name = metric.name
+                    if not name.endswith("_total"):
+                        name += "_total"
+                    self.registry.counter(name, metric.description or name).inc(
+                        update.value, **labels
+                    )
+                case kind if kind == BUFFERED_METRIC_KIND_GAUGE:
+                    self.registry.gauge(
+                        metric.name, metric.description or metric.name
+                    ).set(update.value, **labels)
+                case _:
+                    self.registry.histogram(
+                        metric.name, metric.description or metric.name
+                    ).observe(update.value, **labels)
+
+    async def run(self, interval: float) -> None:
+        """
+        Drain the buffer periodically so it does not fill up between scrapes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.drain()
+
+
+_temporal_metrics: Optional[TemporalMetricsBridge] = None
+
+
+def temporal_metrics() -> TemporalMetricsBridge:
+    """
+    The process-wide Temporal runtime reporting into `REGISTRY`. Pass its `runtime`
+    to `TemporalClient.connect`.
+    """
+    global _temporal_metrics
+    if _temporal_metrics is None:
+        _temporal_metrics = TemporalMetricsBridge(REGISTRY)
+    return _temporal_metrics
+
+
+async def serve_metrics(
+    registry: Registry,
+    host: str,
+    port: int,
+    ready: Optional[Callable[[], bool]] = None,
+) -> asyncio.Server:
+    """
+    A minimal HTTP listener answering `GET /metrics`, for processes without the web
+    app and for each process of multi-process ingress. Rendering runs on the event
+    loop, like every metric update. With `ready`, it also answers `GET /ready` with
+    200 or 503, as the readiness probe of a process without the web app.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.split()
+            path = parts[1] if len(parts) >= 2 and parts[0] == b"GET" else None
+            if path == b"/metrics":
+                status, body = b"200 OK", registry.render().encode("utf-8")
+            elif path == b"/ready" and ready is not None and ready():
+                status, body = b"200 OK", b"OK"
+            elif path == b"/ready" and ready is not None:
+                status, body = b"503 Service Unavailable", b""
+            else:
+                status, body = b"404 Not Found", b""
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
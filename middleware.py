@@ -0,0 +1,135 @@
+import time
+import random
+import logging
+import structlog
+from typing import Iterable, Mapping, Optional
+from asgi_correlation_id.context import correlation_id
+from uvicorn.protocols.utils import get_path_with_query_string
+from starlette.datastructures import URL, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from profiling import SlowRequestRecorder
+
+access_logger = logging.getLogger("fastapi.access")
+
+
+class AccessLogMiddleware:
+    """
+    A pure ASGI replacement for the `@app.middleware("http")` access logger. It binds
+    the request ID to the structlog context, adds `X-Process-Time` to the response,
+    and writes one structured access log entry per request.
+
+    Successful (< 400) responses can be suppressed per path with `skip_paths`, or
+    sampled per path with `sample_rates` (0.0 - 1.0). Error responses are always
+    logged. Nothing is formatted for requests that are not logged.
+
+    With `slow_requests`, the phases of every request are timed and those of slow
+    requests are kept by the recorder.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        skip_paths: Iterable[str] = (),
+        sample_rates: Mapping[str, float] = {},
+        slow_requests: Optional[SlowRequestRecorder] = None,
+    ):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+        self.sample_rates = dict(sample_rates)
+        self.slow_requests = slow_requests
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        structlog.contextvars.clear_contextvars()
+        # These context vars will be added to all log entries emitted during the request
+        request_id = correlation_id.get()
+        structlog.contextvars.bind_contextvars(request_id=request_id)
+
+        timings = self.slow_requests.start() if self.slow_requests is not None else None
+        start_time = time.perf_counter_ns()
+        status_code = 500
+        response_started = False
+
+        async def send_with_process_time(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                process_time = time.perf_counter_ns() - start_time
+                # seconds
+                MutableHeaders(scope=message).append(
+                    "X-Process-Time", str(process_time / 10.0**9)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_process_time)
+        except Exception:
+            logging.getLogger("fastapi.error").exception("Uncaught exception")
+            # We still want to return our own 500 response, so we can add headers
+            # to it (process time, request ID...)
+            if response_started:
+                raise
+            status_code = 500
+            await send_with_process_time(
+                {
+                    "type": "http.response.start",
+                    "status": status_code,
+                    "headers": [(b"content-length", b"0")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            process_time = time.perf_counter_ns() - start_time
+            if timings is not None:
+                self.slow_requests.finish(  # type: ignore
+                    timings,
+                    process_time / 10.0**9,
+                    method=scope["method"],
+                    path=scope["path"],
+                    status_code=status_code,
+                    request_id=request_id,
+                )
+            if self._should_log(scope["path"], status_code):
+                self._log(scope, status_code, process_time, request_id)
+
+    def _should_log(self, path: str, status_code: int) -> bool:
+        if status_code >= 400:
+            return True
+        if path in self.skip_paths:
+            return False
+        sample_rate = self.sample_rates.get(path)
+        return sample_rate is None or random.random() < sample_rate
+
+    def _log(
+        self, scope: Scope, status_code: int, process_time: int, request_id: str | None
+    ) -> None:
+        url = get_path_with_query_string(scope)  # type: ignore
+        client_host, client_port = scope.get("client") or (None, None)
+        http_method = scope["method"]
+        http_version = scope["http_version"]
+        # Recreate the Uvicorn access log format, but add all parameters as structured information
+        message = f"""{client_host}:{client_port} - "{http_method} {url} HTTP/{http_version}" {status_code} {process_time / 10.0**6}ms"""
+        extra = {
+            "http": {
+                "url": str(URL(scope=scope)),
+                "status_code": status_code,
+                "method": http_method,
+                "request_id": request_id,
+                "version": http_version,
+            },
+            "network": {"client": {"ip": client_host, "port": client_port}},
+            "duration": process_time,
+        }
+
+        match status_code:
+            case code if 400 <= code < 500:
+                access_logger.warning(message, extra=extra)
+            case code if code >= 500:
+                access_logger.error(message, extra=extra)
+            case _:
+                access_logger.info(message, extra=extra)
@@ -0,0 +1,50 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+# Activity inputs and names shared by the workflow and the activity worker. This
+# module only depends on the standard library, so workflow code can import it
+# without pulling the LINE SDK, aiohttp or the logging setup into the sandbox.
+
+REPLY_QUICK_REPLY_ACTIVITY = "ReplyQuickReplyActivity"
+REPLY_AUDIO_ACTIVITY = "ReplyAudioActivity"
+MATCH_KEYWORD_ROUTES_ACTIVITY = "MatchKeywordRoutesActivity"
+
+
+@dataclass
+class ReplyTokenParams:
+    reply_token: str
+
+
+@dataclass
+class ReplyQuickReplyActivityParams(ReplyTokenParams):
+    quote_token: str
+    message: str
+    quick_messages: List[str]
+    channel: str = ""
+
+
+@dataclass
+class ReplyAudioActivityParams(ReplyTokenParams):
+    content_url: str
+    duration: int
+    channel: str = ""
+
+
+@dataclass
+class MatchKeywordRoutesActivityParams:
+    channel: str
+    messages: List[str]
+
+
+@dataclass
+class RouteMatch:
+    """
+    A matched route and its reply: `message` and `options` for a quick reply set,
+    `content_url` and `duration` for audio.
+    """
+
+    route: str
+    message: Optional[str] = None
+    options: List[str] = field(default_factory=list)
+    content_url: Optional[str] = None
+    duration: Optional[int] = None
@@ -0,0 +1,150 @@
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Deque, List, Optional, Tuple
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop thread from a background thread and
+    aggregates the samples as collapsed stacks (`frame;frame;frame count` lines),
+    the input format of flamegraph.pl, speedscope and similar tools. Nothing runs
+    while no profile is being taken. Only one profile runs at a time, and at most
+    `max_stacks` distinct stacks are kept; later new stacks are counted as
+    `[truncated]`.
+    """
+
+    def __init__(self, max_stacks: int = 10000):
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, duration: float, interval: float) -> str:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running.")
+        try:
+            stacks = await asyncio.to_thread(
+                self._sample, threading.get_ident(), duration, interval
+            )
+        finally:
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def _sample(self, thread_id: int, duration: float, interval: float) -> Counter:
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = _collapse(frame)
+                if stack in stacks or len(stacks) < self.max_stacks:
+                    stacks[stack] += 1
+                else:
+                    stacks["[truncated]"] += 1
+            time.sleep(interval)
+        return stacks
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    frames: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.reverse()
+    # Flamegraph tools split a line at its last space, so frames may contain spaces.
+    return ";".join(frames)
+
+
+@dataclass
+class RequestTimings:
+    """
+    The phases of one request, in the order they finished. Phases may nest, e.g.
+    every `start_workflow` of a webhook runs inside its `dispatch` phase.
+    """
+
+    phases: List[Tuple[str, float]] = field(default_factory=list)
+
+
+# Only set while the slow request recorder is on, so `record_phase` costs a
+# context variable lookup when it is off.
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_phase(phase: str, start: float) -> None:
+    """
+    Record a phase of the current request that started at `start`
+    (`time.perf_counter()`).
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.phases.append((phase, time.perf_counter() - start))
+
+
+class SlowRequestRecorder:
+    """
+    Keeps the per-phase timings of the last `capacity` requests that took at least
+    `threshold` seconds. The `middleware` phase is the time spent outside the
+    route handler, i.e. in the middleware stack and routing.
+    """
+
+    def __init__(self, threshold: float, capacity: int):
+        self.threshold = threshold
+        self._requests: Deque[dict] = deque(maxlen=capacity)
+
+    def start(self) -> RequestTimings:
+        timings = RequestTimings()
+        _request_timings.set(timings)
+        return timings
+
+    def finish(
+        self,
+        timings: RequestTimings,
+        total: float,
+        method: str,
+        path: str,
+        status_code: int,
+        request_id: Optional[str],
+    ) -> None:
+        _request_timings.set(None)
+        if total < self.threshold:
+            return
+
+        handler = sum(seconds for phase, seconds in timings.phases if phase == "handler")
+        self._requests.append(
+            {
+                "time": time.time(),
+                "method": method,
+                "path": path,
+                "status_code": status_code,
+                "request_id": request_id,
+                "total_ms": round(total * 1000, 3),
+                "phases": [
+                    {"phase": "middleware", "ms": round((total - handler) * 1000, 3)}
+                ]
+                + [
+                    {"phase": phase, "ms": round(seconds * 1000, 3)}
+                    for phase, seconds in timings.phases
+                ],
+            }
+        )
+
+    def requests(self) -> List[dict]:
+        """
+        The recorded requests, the most recent first.
+        """
+        return list(reversed(self._requests))
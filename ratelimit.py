@@ -0,0 +1,113 @@
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class RateLimitWaitTooLongError(Exception):
+    def __init__(self, wait: float):
+        super().__init__(f"The rate limiter would wait {wait:.3f}s for a token.")
+        self.wait = wait
+
+
+class TokenBucket:
+    """
+    A token bucket shared by every reply a worker sends for one channel. Callers
+    wait in FIFO order until a token is available, so a burst is smoothed out to
+    `rate` requests per second instead of being rejected by the LINE API.
+
+    Each caller reserves its token up front: tokens below zero belong to callers
+    that are already waiting. That makes the wait of a new caller known before it
+    waits, so it can give up instead of waiting past its deadline.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        # In the future while paused; tokens only refill after this time.
+        self._updated = time.monotonic()
+
+        self.acquired = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+    def expected_wait(self) -> float:
+        """
+        The seconds a caller of `acquire` would wait right now.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        return max(0.0, self._updated + max(0.0, 1 - self._tokens) / self.rate - now)
+
+    async def acquire(self, max_wait: Optional[float] = None) -> float:
+        """
+        Take one token, waiting for it if needed. Returns the number of seconds
+        the caller waited. Raises `RateLimitWaitTooLongError` without taking a
+        token if the wait would be longer than `max_wait`.
+        """
+        wait = self.expected_wait()
+        if max_wait is not None and wait > max_wait:
+            self.rejected += 1
+            raise RateLimitWaitTooLongError(wait)
+
+        self._tokens -= 1
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._tokens += 1
+                raise
+
+        self.acquired += 1
+        if wait > 0.001:
+            self.delayed += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every new caller for `seconds`, e.g. after the server answered 429
+        with a Retry-After header.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._updated = max(self._updated, now + seconds)
+        self._tokens = min(self._tokens, 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """
+    Parse a Retry-After header given either as delay seconds or as an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
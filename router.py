@@ -0,0 +1,215 @@
+import json
+from pathlib import Path
+from urllib.parse import urljoin
+from typing import Dict, List, Literal, Mapping, Optional, Tuple, Union
+from dataclasses import dataclass
+
+from matcher import AhoCorasick
+
+SUPPORTED_KEYWORD_TABLE_VERSIONS = (1,)
+
+
+def normalize(text: str) -> str:
+    return text.strip().lower().replace(" ", "")
+
+
+@dataclass(frozen=True)
+class AudioReply:
+    content_url: str
+    duration: int
+
+
+@dataclass(frozen=True)
+class QuickReplySet:
+    message: str
+    options: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class KeywordRoute:
+    name: str
+    keywords: Tuple[str, ...]
+    reply: Union[AudioReply, QuickReplySet]
+    # Breaks ties between routes found in the same message, higher first.
+    priority: int = 0
+    # Whether the keywords are also found inside longer messages in substring
+    # mode. Turn it off for short keywords that are common inside other words.
+    substring: bool = True
+
+
+MatchMode = Literal["exact", "substring"]
+MatchPriority = Literal["first", "longest", "route"]
+
+
+@dataclass(frozen=True)
+class MatchOptions:
+    # `exact` only matches a message that is a keyword; `substring` finds keywords
+    # anywhere in the message.
+    mode: MatchMode = "exact"
+    # Which keyword wins when several are found: the one that starts first, the
+    # longest one, or the one whose route has the highest priority.
+    priority: MatchPriority = "first"
+    # Stop scanning after this many keyword occurrences.
+    max_matches: int = 8
+    # Only the first characters of a message are scanned.
+    max_message_length: int = 200
+
+
+class KeywordRouter:
+    """
+    A keyword table compiled into a hash index on the normalized text, so a lookup
+    costs one `normalize` and one dict access no matter how many triggers exist.
+    In substring mode, the keywords are also compiled into an Aho-Corasick
+    automaton that finds every keyword in a message in a single pass; the scan is
+    bounded by `MatchOptions.max_message_length` and `max_matches`.
+    The router is immutable after construction, but a deploy can install another
+    one, so workflows only see its results through the `MatchKeywordRoutes` local
+    activity.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        routes: List[KeywordRoute],
+        match_options: MatchOptions = MatchOptions(),
+    ):
+        if version not in SUPPORTED_KEYWORD_TABLE_VERSIONS:
+            raise ValueError(f"Unsupported keyword table version: {version}.")
+
+        index: Dict[str, KeywordRoute] = {}
+        for route in routes:
+            for keyword in route.keywords:
+                key = normalize(keyword)
+                if not key:
+                    raise ValueError(f"Empty keyword in route {route.name!r}.")
+                if key in index and index[key] is not route:
+                    raise ValueError(
+                        f"Keyword {keyword!r} of route {route.name!r} is already used by route {index[key].name!r}."
+                    )
+                index[key] = route
+
+        self.version = version
+        self.routes = tuple(routes)
+        self.match_options = match_options
+        self._index = index
+        self._automaton: Optional[AhoCorasick[KeywordRoute]] = None
+        if match_options.mode == "substring":
+            self._automaton = AhoCorasick(
+                (key, route) for key, route in index.items() if route.substring
+            )
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def match(self, text: str) -> Optional[KeywordRoute]:
+        if self._automaton is None:
+            return self._index.get(normalize(text))
+
+        # Truncate before normalizing, so a long paste costs no more than a short one.
+        text = normalize(text[: self.match_options.max_message_length])
+        route = self._index.get(text)
+        if route is not None:
+            return route
+
+        best: Optional[KeywordRoute] = None
+        best_key: Tuple[int, ...] = ()
+        for i, (start, end, route) in enumerate(self._automaton.iter_matches(text)):
+            match self.match_options.priority:
+                case "first":
+                    key = (start, start - end)
+                case "longest":
+                    key = (start - end, start)
+                case "route":
+                    key = (-route.priority, start, start - end)
+            if best is None or key < best_key:
+                best, best_key = route, key
+            if i + 1 >= self.match_options.max_matches:
+                break
+        return best
+
+    @classmethod
+    def from_dict(
+        cls,
+        table: dict,
+        media_base_url: Optional[str] = None,
+        durations: Mapping[str, int] = {},
+        match_options: MatchOptions = MatchOptions(),
+    ) -> "KeywordRouter":
+        """
+        Audio replies either give an absolute `content_url`, or a `file` that is
+        resolved against `media_base_url`. The duration of a `file` is taken from
+        `durations` (see `AudioCatalog.durations`) and falls back to the `duration`
+        in the table.
+        """
+        routes: List[KeywordRoute] = []
+        for i, item in enumerate(table["routes"]):
+            name = item.get("name", str(i))
+            reply: Union[AudioReply, QuickReplySet]
+            if "audio" in item:
+                audio = item["audio"]
+                if "content_url" in audio:
+                    content_url = audio["content_url"]
+                elif media_base_url is not None:
+                    content_url = urljoin(media_base_url, audio["file"])
+                else:
+                    raise ValueError(
+                        f"Route {name!r} refers to a media file but no media base URL is set."
+                    )
+                duration = durations.get(audio.get("file", ""), audio.get("duration"))
+                if duration is None:
+                    raise ValueError(f"Route {name!r} has no audio duration.")
+                reply = AudioReply(content_url=content_url, duration=int(duration))
+            elif "quick_reply" in item:
+                reply = QuickReplySet(
+                    message=item["quick_reply"]["message"],
+                    options=tuple(item["quick_reply"]["options"]),
+                )
+            else:
+                raise ValueError(f"Route {name!r} has no reply spec.")
+            routes.append(
+                KeywordRoute(
+                    name=name,
+                    keywords=tuple(item["keywords"]),
+                    reply=reply,
+                    priority=int(item.get("priority", 0)),
+                    substring=bool(item.get("substring", True)),
+                )
+            )
+        return cls(
+            version=int(table["version"]), routes=routes, match_options=match_options
+        )
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[str, Path],
+        media_base_url: Optional[str] = None,
+        durations: Mapping[str, int] = {},
+        match_options: MatchOptions = MatchOptions(),
+    ) -> "KeywordRouter":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(
+                json.load(f),
+                media_base_url=media_base_url,
+                durations=durations,
+                match_options=match_options,
+            )
+
+
+_keyword_routers: Dict[str, KeywordRouter] = {}
+
+
+def install_keyword_router(router: KeywordRouter, channel: str = "") -> None:
+    """
+    Make the compiled router of `channel` available to the `MatchKeywordRoutes`
+    activity, so the router is compiled once per worker process instead of once
+    per match.
+    """
+    _keyword_routers[channel] = router
+
+
+def get_keyword_router(channel: str = "") -> KeywordRouter:
+    router = _keyword_routers.get(channel)
+    if router is None:
+        raise RuntimeError(f"Keyword router is not installed for channel {channel!r}.")
+    return router
@@ -0,0 +1,125 @@
+import os
+import sys
+import socket
+import signal
+import multiprocessing
+from typing import Optional
+from multiprocessing.process import BaseProcess
+from multiprocessing.connection import wait
+
+# This module is imported by every spawned child, so it must stay free of
+# application imports: `config` has to be read after the child's ROLE is set.
+
+
+def _bind_reuseport(host: str, port: int) -> socket.socket:
+    """
+    Every ingress process binds its own listening socket with SO_REUSEPORT, so the
+    kernel balances new connections across processes instead of all of them
+    waking up on one shared accept queue.
+    """
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _uvicorn_config(app, **kwargs):
+    import uvicorn
+
+    # Access logs are written by our own middleware, see `AccessLogMiddleware`.
+    return uvicorn.Config(
+        app,
+        loop="uvloop",
+        http="httptools",
+        log_config=None,
+        access_log=False,
+        **kwargs,
+    )
+
+
+def _run_ingress(host: str, port: int, metrics_port: Optional[int]) -> None:
+    import uvicorn
+
+    # A spawned child has already run the parent's script, `main.py`, as
+    # `__mp_main__`. Importing `main` would run it again and build a second config,
+    # app and startup report, so reuse the loaded module when there is one.
+    main_module = sys.modules.get("__mp_main__")
+    if main_module is not None and hasattr(main_module, "app"):
+        sys.modules.setdefault("main", main_module)
+    from main import app
+
+    app.state.metrics_port = metrics_port
+    server = uvicorn.Server(_uvicorn_config(app))
+    server.run(sockets=[_bind_reuseport(host, port)])
+
+
+def _run_worker() -> None:
+    import uvloop
+    from worker import main
+
+    uvloop.run(main())
+
+
+def _spawn(ctx, role: str, target, args=()) -> BaseProcess:
+    # Spawned children inherit the environment at start time, so ROLE decides what
+    # `config` (and therefore `lifespan`) does in the child.
+    os.environ["ROLE"] = role
+    process = ctx.Process(target=target, args=args, name=role)
+    process.start()
+    return process
+
+
+def serve(
+    app,
+    host: str,
+    port: int,
+    workers: int,
+    role: str,
+    metrics_port: Optional[int] = None,
+) -> None:
+    """
+    Run the web app with uvloop and httptools. With more than one worker, start
+    `workers` ingress-only processes sharing the port through SO_REUSEPORT, each
+    with its own Temporal client. In the combined role, a single headless worker
+    process runs the Temporal worker, so it is never duplicated per ingress process.
+
+    Every process keeps its own metrics, so with `metrics_port` set, ingress
+    process `i` also serves them on `metrics_port + i`, to be scraped one by one.
+    """
+    if workers == 1 or role == "worker":
+        import uvicorn
+
+        uvicorn.Server(_uvicorn_config(app, host=host, port=port)).run()
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        _spawn(
+            ctx,
+            "ingress",
+            _run_ingress,
+            (host, port, metrics_port + i if metrics_port is not None else None),
+        )
+        for i in range(workers)
+    ]
+    if role == "combined":
+        processes.append(_spawn(ctx, "worker", _run_worker))
+    os.environ["ROLE"] = role
+
+    def terminate(*_) -> None:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, terminate)
+    signal.signal(signal.SIGTERM, terminate)
+
+    # If any child exits, stop the others too and let the orchestrator restart us.
+    wait([process.sentinel for process in processes])
+    terminate()
+    for process in processes:
+        process.join()
+
+    exit_codes = [process.exitcode for process in processes]
+    raise SystemExit(max((abs(code or 0) for code in exit_codes), default=0))
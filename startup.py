@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# This module is imported before anything else in `main`, so it must stay free of
+# application and third-party imports.
+
+
+class StartupTimer:
+    """
+    Wall-clock time of each startup phase, from the creation of the timer. The
+    phases are reported once at boot, so a slow scale-up can be traced to imports,
+    connecting to Temporal or loading data.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = seconds
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        The phase durations and the total time so far, in milliseconds.
+        """
+        summary = {f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in self.phases.items()}
+        summary["total_ms"] = round(self.elapsed() * 1000, 1)
+        return summary
@@ -0,0 +1,85 @@
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple, Union
+
+from linebot.v3.messaging import (
+    AudioMessage,
+    Message,
+    MessageAction,
+    QuickReply,
+    QuickReplyItem,
+    ReplyMessageRequest,
+    TextMessage,
+)
+
+from router import AudioReply, QuickReplySet
+
+# Replies are fixed per keyword route, so this only has to hold one template per
+# route. The bound keeps arbitrary activity inputs from growing it without limit.
+TEMPLATE_CACHE_SIZE = 256
+
+
+class ReplyTemplate:
+    """
+    A reply whose messages were built and validated once through the SDK models and
+    are kept as the JSON-ready dict the SDK would send. Rendering a reply only fills
+    in the tokens, so no pydantic model is built or validated per reply.
+    """
+
+    def __init__(self, messages: List[Message]):
+        # Validate the whole request (message count, quick reply limits...) with a
+        # placeholder token, so a bad template fails here instead of per reply.
+        body = ReplyMessageRequest(reply_token="template", messages=messages).to_dict()  # type: ignore
+        del body["replyToken"]
+        self.messages: Tuple[dict, ...] = tuple(body.pop("messages"))
+        self.fields = body
+
+    def render(self, reply_token: str, quote_token: Optional[str] = None) -> dict:
+        """
+        The request body for `reply_token`. `quote_token` is set on the first
+        message. The template's message dicts are shared, never modified.
+        """
+        messages = list(self.messages)
+        if quote_token is not None:
+            messages[0] = {**messages[0], "quoteToken": quote_token}
+        return {**self.fields, "replyToken": reply_token, "messages": messages}
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def quick_reply_template(message: str, options: Tuple[str, ...]) -> ReplyTemplate:
+    return ReplyTemplate(
+        [
+            TextMessage(
+                text=message,
+                quick_reply=QuickReply(  # type: ignore
+                    items=[
+                        QuickReplyItem(action=MessageAction(label=text, text=text))
+                        for text in options  # type: ignore
+                    ]
+                ),
+            )
+        ]
+    )
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def audio_template(content_url: str, duration: int) -> ReplyTemplate:
+    return ReplyTemplate(
+        [AudioMessage(original_content_url=content_url, duration=duration)]
+    )
+
+
+def prebuild_reply_templates(
+    replies: Sequence[Union[AudioReply, QuickReplySet]],
+) -> int:
+    """
+    Build the templates of every keyword route reply ahead of the first message, so
+    an invalid reply in the keyword table fails at startup. Returns the number of
+    templates built.
+    """
+    for reply in replies:
+        match reply:
+            case QuickReplySet(message=message, options=options):
+                quick_reply_template(message, options)
+            case AudioReply(content_url=content_url, duration=duration):
+                audio_template(content_url, duration)
+    return len(replies)
@@ -0,0 +1,6 @@
+import os
+
+# `config` reads these at import time; the tests never talk to LINE.
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test")
+os.environ.setdefault("LOG_LEVEL", "warning")
@@ -0,0 +1,61 @@
+from catalog import mp3_duration
+
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz, no padding: 417 bytes and 1152 samples.
+STEREO_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+MONO_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+FRAME_LENGTH = 417
+FRAME_MS = 1152 * 1000 / 44100
+
+
+def frame(header=STEREO_HEADER, payload=b""):
+    return (header + payload).ljust(FRAME_LENGTH, b"\x00")
+
+
+def vbr_frame(tag, frames, header=STEREO_HEADER, side_info=32):
+    return frame(
+        header,
+        b"\x00" * side_info + tag + (1).to_bytes(4, "big") + frames.to_bytes(4, "big"),
+    )
+
+
+def id3v2(size):
+    # The tag size is a 28-bit synchsafe integer.
+    synchsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + synchsafe + b"\x00" * size
+
+
+def test_cbr_walks_every_frame():
+    assert mp3_duration(frame() * 10) == round(10 * FRAME_MS)
+
+
+def test_xing_header_frame_count():
+    data = vbr_frame(b"Xing", 1000) + frame() * 3
+    assert mp3_duration(data) == round(1000 * FRAME_MS)
+
+
+def test_info_header_frame_count():
+    data = vbr_frame(b"Info", 500) + frame() * 3
+    assert mp3_duration(data) == round(500 * FRAME_MS)
+
+
+def test_xing_header_of_mono_stream():
+    data = vbr_frame(b"Xing", 1000, header=MONO_HEADER, side_info=17) + frame(MONO_HEADER)
+    assert mp3_duration(data) == round(1000 * FRAME_MS)
+
+
+def test_xing_header_without_frame_count_falls_back_to_walking():
+    first = frame(STEREO_HEADER, b"\x00" * 32 + b"Xing" + (0).to_bytes(4, "big"))
+    assert mp3_duration(first + frame() * 3) == round(4 * FRAME_MS)
+
+
+def test_id3v2_tag_is_skipped():
+    assert mp3_duration(id3v2(300) + frame() * 5) == round(5 * FRAME_MS)
+
+
+def test_stray_sync_bytes_before_first_frame():
+    assert mp3_duration(b"\xff\xfb\x00junk" + frame() * 4) == round(4 * FRAME_MS)
+
+
+def test_no_frames():
+    assert mp3_duration(b"") is None
+    assert mp3_duration(b"not an mp3 file" * 10) is None
@@ -0,0 +1,71 @@
+import pytest
+
+import dedup
+from dedup import EventDedupCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(dedup, "time", clock)
+    return clock
+
+
+def test_hit_and_miss(clock):
+    cache = EventDedupCache(maxsize=10, ttl=60)
+    cache.add("a")
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = EventDedupCache(maxsize=10, ttl=60)
+    cache.add("a")
+    clock.now = 61
+    assert "a" not in cache
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_hit_refreshes_expiry(clock):
+    cache = EventDedupCache(maxsize=10, ttl=60)
+    cache.add("a")
+    clock.now = 50
+    assert "a" in cache
+    clock.now = 100
+    assert "a" in cache
+
+
+def test_add_prunes_expired_entries(clock):
+    cache = EventDedupCache(maxsize=10, ttl=60)
+    cache.add("a")
+    cache.add("b")
+    clock.now = 30
+    cache.add("c")
+    clock.now = 61
+    cache.add("d")
+    assert len(cache) == 2
+    assert cache.stats()["expirations"] == 2
+    assert "c" in cache
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = EventDedupCache(maxsize=2, ttl=60)
+    cache.add("a")
+    cache.add("b")
+    assert "a" in cache
+    cache.add("c")
+    assert "b" not in cache
+    assert "a" in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
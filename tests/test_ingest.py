@@ -0,0 +1,124 @@
+import asyncio
+
+from dispatch import DispatchResult, TextMessageEvent
+from ingest import IngestQueue
+
+
+class FakeDispatcher:
+    """
+    Records the dispatched events; holds every dispatch until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+
+    async def start(self, event: TextMessageEvent) -> DispatchResult:
+        await self.release.wait()
+        self.started.append(event.webhook_event_id)
+        return DispatchResult(webhook_event_id=event.webhook_event_id)
+
+
+def events(*ids):
+    return [
+        TextMessageEvent(webhook_event_id=id, reply_token="", quote_token="", text="noot")
+        for id in ids
+    ]
+
+
+def queued_ids(queue):
+    return [event.webhook_event_id for _, event in queue._items]
+
+
+def test_reject_refuses_a_batch_that_does_not_fit():
+    async def main():
+        queue = IngestQueue(FakeDispatcher(), maxsize=3, workers=1, full_policy="reject")
+        assert await queue.put(events("a", "b"))
+        assert not await queue.put(events("c", "d"))
+        assert await queue.put(events("c"))
+        assert queued_ids(queue) == ["a", "b", "c"]
+        assert queue.stats()["rejected"] == 2
+
+    asyncio.run(main())
+
+
+def test_drop_oldest_evicts_queued_events():
+    async def main():
+        queue = IngestQueue(FakeDispatcher(), maxsize=3, workers=1, full_policy="drop_oldest")
+        assert await queue.put(events("a", "b"))
+        assert await queue.put(events("c", "d"))
+        assert queued_ids(queue) == ["b", "c", "d"]
+        assert await queue.put(events("e", "f", "g", "h"))
+        assert queued_ids(queue) == ["f", "g", "h"]
+        assert queue.stats()["dropped"] == 5
+
+    asyncio.run(main())
+
+
+def test_block_waits_for_room():
+    async def main():
+        dispatcher = FakeDispatcher()
+        queue = IngestQueue(dispatcher, maxsize=2, workers=1, full_policy="block")
+        queue.start()
+        assert await queue.put(events("a", "b"))
+        await asyncio.sleep(0)  # The dispatcher takes "a" and waits on `release`.
+
+        put = asyncio.create_task(queue.put(events("c", "d")))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        assert queued_ids(queue) == ["b", "c"]
+
+        dispatcher.release.set()
+        assert await put
+        await queue.close(timeout=1)
+        assert dispatcher.started == ["a", "b", "c", "d"]
+
+    asyncio.run(main())
+
+
+def test_close_drains_queued_and_in_flight_events():
+    async def main():
+        dispatcher = FakeDispatcher()
+        queue = IngestQueue(dispatcher, maxsize=10, workers=2, full_policy="reject")
+        queue.start()
+        assert await queue.put(events("a", "b", "c"))
+        await asyncio.sleep(0)
+
+        close = asyncio.create_task(queue.close(timeout=1))
+        await asyncio.sleep(0)
+        assert not await queue.put(events("d"))
+
+        dispatcher.release.set()
+        await close
+        assert sorted(dispatcher.started) == ["a", "b", "c"]
+        assert queue.stats()["dispatched"] == 3
+        assert queue.stats()["depth"] == 0
+        assert queue.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_close_gives_up_after_timeout():
+    async def main():
+        dispatcher = FakeDispatcher()
+        queue = IngestQueue(dispatcher, maxsize=10, workers=1, full_policy="reject")
+        queue.start()
+        assert await queue.put(events("a", "b"))
+        await queue.close(timeout=0.01)
+        assert dispatcher.started == []
+        assert queue.stats()["dispatched"] == 0
+
+    asyncio.run(main())
+
+
+def test_blocked_put_is_refused_on_close():
+    async def main():
+        queue = IngestQueue(FakeDispatcher(), maxsize=1, workers=1, full_policy="block")
+        assert await queue.put(events("a"))
+        put = asyncio.create_task(queue.put(events("b")))
+        await asyncio.sleep(0)
+        await queue.close(timeout=0.01)
+        assert not await put
+        assert queue.stats()["rejected"] == 1
+
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from matcher import AhoCorasick
+from router import KeywordRoute, KeywordRouter, MatchOptions, QuickReplySet
+
+
+def naive_matches(patterns, text):
+    return sorted(
+        (start, start + len(pattern), pattern)
+        for pattern in patterns
+        for start in range(len(text) - len(pattern) + 1)
+        if text.startswith(pattern, start)
+    )
+
+
+@pytest.mark.parametrize(
+    "patterns, text",
+    [
+        (["he", "she", "his", "hers"], "ushers"),
+        (["a", "aa", "aaa"], "aaaa"),
+        (["noot", "pingu", "ngu"], "noot noot said pingu"),
+        (["abc"], "xyz"),
+        (["abc"], ""),
+    ],
+)
+def test_matches_naive_search(patterns, text):
+    automaton = AhoCorasick((pattern, pattern) for pattern in patterns)
+    assert sorted(automaton.iter_matches(text)) == naive_matches(patterns, text)
+
+
+def test_matches_naive_search_on_random_text():
+    rng = random.Random(0)
+    for _ in range(200):
+        patterns = {
+            "".join(rng.choices("ab", k=rng.randint(1, 4))) for _ in range(rng.randint(1, 6))
+        }
+        text = "".join(rng.choices("abc", k=rng.randint(0, 30)))
+        automaton = AhoCorasick((pattern, pattern) for pattern in patterns)
+        assert sorted(automaton.iter_matches(text)) == naive_matches(patterns, text)
+
+
+def test_matches_are_ordered_by_end():
+    automaton = AhoCorasick((pattern, pattern) for pattern in ["bcd", "abcde", "c"])
+    ends = [end for _, end, _ in automaton.iter_matches("abcde")]
+    assert ends == sorted(ends)
+
+
+def test_empty_pattern_is_rejected():
+    with pytest.raises(ValueError):
+        AhoCorasick([("", None)])
+
+
+def route(name, keyword, priority=0, substring=True):
+    return KeywordRoute(
+        name=name,
+        keywords=(keyword,),
+        reply=QuickReplySet(message=name, options=()),
+        priority=priority,
+        substring=substring,
+    )
+
+
+ROUTES = [
+    route("short", "noot", priority=1),
+    route("long", "pingu", priority=0),
+    route("high", "robby", priority=5),
+    route("whole", "ok", substring=False),
+]
+
+
+def router(priority, **options):
+    return KeywordRouter(1, ROUTES, MatchOptions(mode="substring", priority=priority, **options))
+
+
+@pytest.mark.parametrize(
+    "priority, text, expected",
+    [
+        ("first", "noot and pingu", "short"),
+        ("first", "pingu and noot", "long"),
+        ("longest", "noot and pingu", "long"),
+        ("longest", "pingu and noot", "long"),
+        ("route", "noot pingu robby", "high"),
+        ("route", "pingu noot", "short"),
+    ],
+)
+def test_priority_modes(priority, text, expected):
+    assert router(priority).match(text).name == expected
+
+
+def test_exact_match_wins_over_substrings():
+    assert router("longest").match(" Noot ").name == "short"
+
+
+def test_substring_off_only_matches_whole_message():
+    assert router("first").match("book") is None
+    assert router("first").match("OK").name == "whole"
+
+
+def test_exact_mode_ignores_substrings():
+    exact = KeywordRouter(1, ROUTES, MatchOptions(mode="exact"))
+    assert exact.match("noot and pingu") is None
+    assert exact.match("Pingu").name == "long"
+
+
+def test_scan_is_bounded():
+    assert router("first", max_message_length=10).match("0123456789noot") is None
+    assert router("route", max_matches=1).match("noot robby").name == "short"
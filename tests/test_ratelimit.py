@@ -0,0 +1,153 @@
+import time
+import types
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+import ratelimit
+from ratelimit import RateLimitWaitTooLongError, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """
+    Time only moves when a test advances it. `sleep` records the delay and returns
+    at once, or waits for `release` while `hold` is set.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.hold = False
+        self.release = asyncio.Event()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        if self.hold:
+            await self.release.wait()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    monkeypatch.setattr(
+        ratelimit,
+        "asyncio",
+        types.SimpleNamespace(sleep=clock.sleep, CancelledError=asyncio.CancelledError),
+    )
+    return clock
+
+
+def test_burst_is_taken_without_waiting(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=2)
+        assert await bucket.acquire() == 0
+        assert await bucket.acquire() == 0
+        assert clock.sleeps == []
+
+    asyncio.run(main())
+
+
+def test_callers_wait_in_fifo_order(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=2)
+        waits = await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+        assert waits == pytest.approx([0, 0, 0.1, 0.2, 0.3])
+        assert bucket.stats()["delayed"] == 3
+
+    asyncio.run(main())
+
+
+def test_tokens_refill_over_time(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=2)
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        clock.now = 0.1
+        assert bucket.expected_wait() == 0
+        clock.now = 10
+        assert await bucket.acquire() == 0
+        assert await bucket.acquire() == 0
+        assert bucket.expected_wait() == pytest.approx(0.1)
+
+    asyncio.run(main())
+
+
+def test_wait_longer_than_max_wait_is_rejected_without_taking_a_token(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=1)
+        await bucket.acquire()
+        with pytest.raises(RateLimitWaitTooLongError) as e:
+            await bucket.acquire(max_wait=0.05)
+        assert e.value.wait == pytest.approx(0.1)
+        assert bucket.expected_wait() == pytest.approx(0.1)
+        assert await bucket.acquire(max_wait=0.1) == pytest.approx(0.1)
+        assert bucket.stats()["rejected"] == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_returns_its_token(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=1)
+        await bucket.acquire()
+        clock.hold = True
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        assert bucket.expected_wait() == pytest.approx(0.2)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert bucket.expected_wait() == pytest.approx(0.1)
+        assert bucket.stats()["acquired"] == 1
+
+    asyncio.run(main())
+
+
+def test_pause_holds_new_callers(clock):
+    async def main():
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.pause(2)
+        assert await bucket.acquire() == pytest.approx(2.1)
+        assert bucket.expected_wait() == pytest.approx(2.2)
+
+        clock.now = 3
+        assert bucket.expected_wait() == 0
+
+    asyncio.run(main())
+
+
+def test_pause_does_not_shorten_a_longer_pause(clock):
+    bucket = TokenBucket(rate=10, burst=5)
+    bucket.pause(5)
+    bucket.pause(1)
+    assert bucket.expected_wait() == pytest.approx(5.1)
+
+
+def test_delay_seconds():
+    assert parse_retry_after("5", default=1.0) == 5.0
+    assert parse_retry_after("0.5", default=1.0) == 0.5
+
+
+def test_negative_delay_is_clamped():
+    assert parse_retry_after("-3", default=1.0) == 0.0
+
+
+def test_http_date():
+    value = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= parse_retry_after(value, default=1.0) <= 30
+
+
+def test_http_date_in_the_past():
+    value = formatdate(time.time() - 30, usegmt=True)
+    assert parse_retry_after(value, default=1.0) == 0.0
+
+
+def test_missing_or_invalid_value_uses_default():
+    assert parse_retry_after(None, default=1.0) == 1.0
+    assert parse_retry_after("", default=1.0) == 1.0
+    assert parse_retry_after("soon", default=1.0) == 1.0
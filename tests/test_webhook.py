@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+from benchmarks.payloads import (
+    follow_event,
+    sign,
+    sticker_event,
+    text_event,
+    webhook_body,
+)
+from webhook import (
+    FastWebhookParser,
+    InvalidSignatureError,
+    InvalidWebhookBodyError,
+    SdkWebhookParser,
+    webhook_destination,
+)
+
+SECRET = "channel-secret"
+
+
+def parse(body: bytes, channel: str = ""):
+    return FastWebhookParser(SECRET, channel=channel).parse(body, sign(SECRET, body))
+
+
+def test_valid_signature():
+    body = webhook_body([text_event("noot")])
+    assert FastWebhookParser(SECRET).verify(body, sign(SECRET, body))
+
+
+def test_signature_is_checked_with_a_copy_of_the_keyed_hmac():
+    parser = FastWebhookParser(SECRET)
+    first = webhook_body([text_event("noot")])
+    second = webhook_body([text_event("pingu")])
+    assert parser.verify(first, sign(SECRET, first))
+    assert parser.verify(second, sign(SECRET, second))
+
+
+def test_tampered_body_is_rejected():
+    body = webhook_body([text_event("noot")])
+    signature = sign(SECRET, body)
+    with pytest.raises(InvalidSignatureError):
+        FastWebhookParser(SECRET).parse(body.replace(b"noot", b"toon"), signature)
+
+
+@pytest.mark.parametrize(
+    "signature",
+    [
+        "",
+        "not base64",
+        "ｓｉｇｎａｔｕｒｅ",
+        "簽名" * 22,
+    ],
+)
+def test_invalid_signature_is_rejected(signature):
+    body = webhook_body([text_event("noot")])
+    with pytest.raises(InvalidSignatureError):
+        FastWebhookParser(SECRET).parse(body, signature)
+
+
+def test_signature_of_another_secret_is_rejected():
+    body = webhook_body([text_event("noot")])
+    with pytest.raises(InvalidSignatureError):
+        FastWebhookParser(SECRET).parse(body, sign("other-secret", body))
+
+
+def test_tampered_signature_is_rejected():
+    body = webhook_body([text_event("noot")])
+    signature = sign(SECRET, body)
+    tampered = ("A" if signature[0] != "A" else "B") + signature[1:]
+    with pytest.raises(InvalidSignatureError):
+        FastWebhookParser(SECRET).parse(body, tampered)
+
+
+def test_only_text_message_events_are_extracted():
+    events = [sticker_event(), text_event("noot"), follow_event(), text_event("pingu")]
+    assert [event.text for event in parse(webhook_body(events))] == ["noot", "pingu"]
+
+
+def test_text_message_fields():
+    event = text_event("noot noot", source_id="C123", redelivery=True)
+    [parsed] = parse(webhook_body([event]), channel="pingu")
+    assert parsed.webhook_event_id == event["webhookEventId"]
+    assert parsed.reply_token == event["replyToken"]
+    assert parsed.quote_token == event["message"]["quoteToken"]
+    assert parsed.text == "noot noot"
+    assert parsed.is_redelivery
+    assert parsed.channel == "pingu"
+    assert parsed.source == "C123"
+
+
+def test_source_falls_back_to_room_and_user():
+    room = text_event("noot")
+    room["source"] = {"type": "room", "roomId": "R123", "userId": "U123"}
+    user = text_event("noot")
+    user["source"] = {"type": "user", "userId": "U123"}
+    missing = text_event("noot")
+    del missing["source"]
+    del missing["deliveryContext"]
+
+    parsed = parse(webhook_body([room, user, missing]))
+    assert [event.source for event in parsed] == ["R123", "U123", ""]
+    assert not parsed[2].is_redelivery
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"not json",
+        b"[]",
+        b'{"destination": "U1"}',
+        b'{"events": [null]}',
+        b'{"events": [{"type": "message"}]}',
+        b'{"events": [{"type": "message", "message": {"type": "text"}}]}',
+    ],
+)
+def test_malformed_body_is_rejected(body):
+    with pytest.raises(InvalidWebhookBodyError):
+        parse(body)
+
+
+def test_destination():
+    body = webhook_body([text_event("noot")], destination="U42")
+    assert webhook_destination(body) == "U42"
+    assert webhook_destination(b'{"events": []}') is None
+
+
+def test_matches_the_sdk_parser():
+    events = [
+        text_event("noot"),
+        sticker_event(),
+        text_event("驚訝", source_id="C456", redelivery=True),
+        follow_event(),
+    ]
+    body = webhook_body(events)
+    signature = sign(SECRET, body)
+
+    fast = FastWebhookParser(SECRET, channel="pingu").parse(body, signature)
+    sdk = SdkWebhookParser(SECRET, channel="pingu").parse(body, signature)
+    assert fast == sdk
+    assert len(fast) == 2
+
+
+def test_sdk_parser_rejects_the_same_signatures():
+    body = webhook_body([text_event("noot")])
+    tampered = json.dumps(json.loads(body)).encode("utf-8") + b" "
+    with pytest.raises(InvalidSignatureError):
+        SdkWebhookParser(SECRET).parse(tampered, sign(SECRET, body))
+    with pytest.raises(InvalidSignatureError):
+        FastWebhookParser(SECRET).parse(tampered, sign(SECRET, body))
@@ -0,0 +1,179 @@
+import uuid
+import asyncio
+from datetime import timedelta
+from typing import List, Optional
+
+import pytest
+from temporalio import activity
+from temporalio.client import WorkflowHandle
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker
+
+from params import (
+    MATCH_KEYWORD_ROUTES_ACTIVITY,
+    REPLY_AUDIO_ACTIVITY,
+    REPLY_QUICK_REPLY_ACTIVITY,
+    MatchKeywordRoutesActivityParams,
+    ReplyAudioActivityParams,
+    ReplyQuickReplyActivityParams,
+    RouteMatch,
+)
+from worker import workflow_runner
+from workflow import (
+    CoalesceOptions,
+    CoalesceTextMessagesWorkflow,
+    CoalesceTextMessagesWorkflowParams,
+    SourceTextMessage,
+)
+
+TASK_QUEUE = "TEST:COALESCE"
+
+
+class FakeActivities:
+    """
+    Routes every message to the route of the same name, except `ignored`, and
+    records the reply token of every reply. While `hold` is set, matching waits
+    for `release`.
+    """
+
+    def __init__(self):
+        self.replies: List[str] = []
+        self.matched = asyncio.Event()
+        self.hold = False
+        self.release = asyncio.Event()
+
+    @activity.defn(name=MATCH_KEYWORD_ROUTES_ACTIVITY)
+    async def match_keyword_routes(
+        self, input: MatchKeywordRoutesActivityParams
+    ) -> List[Optional[RouteMatch]]:
+        self.matched.set()
+        if self.hold:
+            await self.release.wait()
+        return [
+            RouteMatch(message, message=message) if message != "ignored" else None
+            for message in input.messages
+        ]
+
+    @activity.defn(name=REPLY_QUICK_REPLY_ACTIVITY)
+    async def reply_quick_reply(self, input: ReplyQuickReplyActivityParams) -> dict:
+        self.replies.append(input.reply_token)
+        return {}
+
+    @activity.defn(name=REPLY_AUDIO_ACTIVITY)
+    async def reply_audio(self, input: ReplyAudioActivityParams) -> dict:
+        self.replies.append(input.reply_token)
+        return {}
+
+
+async def start_env() -> WorkflowEnvironment:
+    try:
+        return await WorkflowEnvironment.start_time_skipping()
+    except RuntimeError as e:
+        pytest.skip(f"Temporal test server is not available: {e}")
+
+
+def message(event_id: str, text: str) -> SourceTextMessage:
+    return SourceTextMessage(
+        webhook_event_id=event_id,
+        reply_token=f"reply-{event_id}",
+        quote_token=f"quote-{event_id}",
+        message=text,
+    )
+
+
+async def start(
+    env: WorkflowEnvironment, first: SourceTextMessage, options: CoalesceOptions
+) -> WorkflowHandle:
+    return await env.client.start_workflow(
+        CoalesceTextMessagesWorkflow.run,
+        CoalesceTextMessagesWorkflowParams(channel="", source="user", options=options),
+        id=f"coalesce:{uuid.uuid4()}",
+        task_queue=TASK_QUEUE,
+        start_signal="message",
+        start_signal_args=[first],
+    )
+
+
+def run(test):
+    async def main():
+        activities = FakeActivities()
+        async with await start_env() as env:
+            async with Worker(
+                env.client,
+                task_queue=TASK_QUEUE,
+                workflows=[CoalesceTextMessagesWorkflow],
+                activities=[
+                    activities.match_keyword_routes,
+                    activities.reply_quick_reply,
+                    activities.reply_audio,
+                ],
+                workflow_runner=workflow_runner(),
+            ):
+                await test(env, activities)
+
+    asyncio.run(main())
+
+
+def test_burst_is_answered_once_per_route_with_the_latest_message():
+    async def test(env, activities):
+        handle = await start(env, message("1", "noot"), CoalesceOptions())
+        await handle.signal("message", message("2", "noot"))
+        await handle.signal("message", message("3", "ignored"))
+        await handle.signal("message", message("4", "pingu"))
+        # A redelivery of an event already in the burst.
+        await handle.signal("message", message("2", "noot"))
+
+        assert await handle.result() == 2
+        assert sorted(activities.replies) == ["reply-2", "reply-4"]
+
+    run(test)
+
+
+def test_replies_per_burst_are_capped():
+    async def test(env, activities):
+        options = CoalesceOptions(max_replies_per_window=2)
+        handle = await start(env, message("1", "noot"), options)
+        await handle.signal("message", message("2", "pingu"))
+        await handle.signal("message", message("3", "robby"))
+
+        assert await handle.result() == 2
+        assert sorted(activities.replies) == ["reply-2", "reply-3"]
+
+    run(test)
+
+
+def test_messages_after_a_burst_are_answered_before_idle_completion():
+    async def test(env, activities):
+        options = CoalesceOptions(idle_timeout_seconds=60)
+        handle = await start(env, message("1", "noot"), options)
+        await env.sleep(timedelta(seconds=10))
+        assert activities.replies == ["reply-1"]
+
+        await handle.signal("message", message("2", "noot"))
+        assert await handle.result() == 2
+        assert activities.replies == ["reply-1", "reply-2"]
+
+    run(test)
+
+
+def test_continue_as_new_carries_pending_messages():
+    async def test(env, activities):
+        options = CoalesceOptions(max_messages_per_run=1)
+        activities.hold = True
+        handle = await start(env, message("1", "noot"), options)
+
+        # Arrives while the first burst is being matched, so it is still pending
+        # when the run continues as new.
+        await activities.matched.wait()
+        await handle.signal("message", message("2", "pingu"))
+        activities.hold = False
+        activities.release.set()
+
+        # The handle follows the run chain to the last run, which only answered
+        # the carried message.
+        assert await handle.result() == 1
+        assert activities.replies == ["reply-1", "reply-2"]
+        latest = await env.client.get_workflow_handle(handle.id).describe()
+        assert latest.run_id != handle.first_execution_run_id
+
+    run(test)
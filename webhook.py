@@ -0,0 +1,170 @@
+import re
+import hmac
+import json
+import logging
+import base64
+import hashlib
+from typing import List, Literal, Optional
+
+from config import logger
+from metrics import WEBHOOK_PARSE_SECONDS, WEBHOOK_SIGNATURE_SECONDS
+from dispatch import TextMessageEvent
+
+WebhookParserMode = Literal["fast", "sdk"]
+
+
+# Quotes inside JSON strings are escaped, so this only matches a real key. LINE
+# sends `destination` as the first key, so the search stops after a few bytes.
+_DESTINATION_PATTERN = re.compile(rb'"destination"\s*:\s*"([^"\\]*)"')
+
+
+class InvalidWebhookBodyError(ValueError):
+    pass
+
+
+class InvalidSignatureError(ValueError):
+    """
+    Our own counterpart of `linebot.v3.exceptions.InvalidSignatureError`. Importing
+    anything from `linebot.v3` imports its whole webhook and messaging model tree,
+    which the fast parser does not need.
+    """
+
+
+def _source_id(source: dict) -> str:
+    # A message in a group or room comes from a user, but the conversation it is
+    # answered in is the group or room.
+    return source.get("groupId") or source.get("roomId") or source.get("userId") or ""
+
+
+def webhook_destination(body: bytes) -> Optional[str]:
+    """
+    The bot user ID a webhook was sent to, read without parsing the body. It is
+    only used to pick the channel secret; the signature still covers the body.
+    """
+    match = _DESTINATION_PATTERN.search(body)
+    return match.group(1).decode("utf-8") if match is not None else None
+
+
+class FastWebhookParser:
+    """
+    Verifies the signature on the raw request bytes and pulls only the fields the
+    workflow needs out of text message events. Other event types are skipped
+    without building any model for them.
+    """
+
+    def __init__(self, channel_secret: str, channel: str = ""):
+        self.channel = channel
+        # Keying HMAC once and copying the prepared state per request skips the
+        # key padding and inner/outer pad hashing on every call.
+        self._hmac = hmac.new(channel_secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def verify(self, body: bytes, signature: str) -> bool:
+        mac = self._hmac.copy()
+        mac.update(body)
+        return hmac.compare_digest(
+            base64.b64encode(mac.digest()), signature.encode("utf-8")
+        )
+
+    def parse(self, body: bytes, signature: str) -> List[TextMessageEvent]:
+        with WEBHOOK_SIGNATURE_SECONDS.time(parser="fast"):
+            verified = self.verify(body, signature)
+        if not verified:
+            raise InvalidSignatureError(
+                f"Invalid signature. signature={signature}"
+            )
+
+        with WEBHOOK_PARSE_SECONDS.time(parser="fast"):
+            return self._extract(body)
+
+    def _extract(self, body: bytes) -> List[TextMessageEvent]:
+        try:
+            payload = json.loads(body)
+            text_events: List[TextMessageEvent] = []
+            for event in payload["events"]:
+                if event.get("type") != "message":
+                    continue
+                message = event["message"]
+                if message.get("type") != "text":
+                    continue
+                text_events.append(
+                    TextMessageEvent(
+                        webhook_event_id=event["webhookEventId"],
+                        reply_token=event["replyToken"],
+                        quote_token=message["quoteToken"],
+                        text=message["text"],
+                        is_redelivery=event.get("deliveryContext", {}).get(
+                            "isRedelivery", False
+                        ),
+                        channel=self.channel,
+                        source=_source_id(event.get("source") or {}),
+                    )
+                )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Received webhook events.",
+                    extra={"events": payload["events"], "text_events": len(text_events)},
+                )
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise InvalidWebhookBodyError(f"Malformed webhook body: {e!r}") from e
+
+        return text_events
+
+
+class SdkWebhookParser:
+    """
+    Parses webhooks with the full LINE SDK models. Slower, but validates every
+    event against the SDK schema.
+    """
+
+    def __init__(self, channel_secret: str, channel: str = ""):
+        from linebot.v3.webhook import WebhookParser
+
+        self.channel = channel
+        self._parser = WebhookParser(channel_secret)
+
+    def parse(self, body: bytes, signature: str) -> List[TextMessageEvent]:
+        from linebot.v3.exceptions import InvalidSignatureError as SdkInvalidSignatureError
+        from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+        # The SDK verifies the signature inside `parse`, so both are timed together.
+        with WEBHOOK_PARSE_SECONDS.time(parser="sdk"):
+            try:
+                events = self._parser.parse(body.decode("utf-8"), signature)
+            except SdkInvalidSignatureError as e:
+                raise InvalidSignatureError(e.message) from e
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        text_events: List[TextMessageEvent] = []
+        for event in events:  # type: ignore
+            if debug:
+                logger.debug("Received webhook event.", extra={"event": event})
+            if not isinstance(event, MessageEvent):
+                continue
+            if not isinstance(event.message, TextMessageContent):
+                continue
+
+            text_events.append(
+                TextMessageEvent(
+                    webhook_event_id=event.webhook_event_id,
+                    reply_token=event.reply_token,  # type: ignore
+                    quote_token=event.message.quote_token,
+                    text=event.message.text,
+                    is_redelivery=event.delivery_context.is_redelivery,
+                    channel=self.channel,
+                    source=_source_id(
+                        event.source.to_dict() if event.source is not None else {}
+                    ),
+                )
+            )
+
+        return text_events
+
+
+def create_webhook_parser(
+    mode: WebhookParserMode, channel_secret: str, channel: str = ""
+) -> FastWebhookParser | SdkWebhookParser:
+    match mode:
+        case "fast":
+            return FastWebhookParser(channel_secret, channel=channel)
+        case "sdk":
+            return SdkWebhookParser(channel_secret, channel=channel)
@@ -0,0 +1,252 @@
+import signal
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Union
+from contextlib import AsyncExitStack, asynccontextmanager
+from temporalio.client import Client as TemporalClient
+from temporalio.worker import Worker as TemporalWorker, UnsandboxedWorkflowRunner
+from temporalio.worker.workflow_sandbox import SandboxedWorkflowRunner, SandboxRestrictions
+
+from config import config, logger
+from workflow import CoalesceTextMessagesWorkflow, HandleTextMessageWorkflow
+from activity import ReplyActivity, ReplyChannel, match_keyword_routes
+from line_api import LineApiPool
+from ratelimit import TokenBucket
+from metrics import REGISTRY, serve_metrics, temporal_metrics
+from catalog import AudioCatalog
+from router import KeywordRouter, MatchOptions, install_keyword_router
+from templates import prebuild_reply_templates
+from startup import StartupTimer
+
+
+def worker_tuning_options() -> dict:
+    """
+    Worker concurrency settings from `Config`. Unset settings are left out so the
+    Temporal SDK defaults apply.
+    """
+    options = {
+        "max_concurrent_activities": config.temporal_worker_max_concurrent_activities,
+        "max_concurrent_local_activities": config.temporal_worker_max_concurrent_local_activities,
+        "max_concurrent_workflow_tasks": config.temporal_worker_max_concurrent_workflow_tasks,
+        "max_concurrent_workflow_task_polls": config.temporal_worker_max_concurrent_workflow_task_polls,
+        "max_concurrent_activity_task_polls": config.temporal_worker_max_concurrent_activity_task_polls,
+        "max_cached_workflows": config.temporal_worker_max_cached_workflows,
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+# The modules `workflow` imports. They are deterministic and stdlib-only apart from
+# the Temporal SDK, so the sandbox can share the worker's copies instead of
+# importing them again for every workflow run.
+SANDBOX_PASSTHROUGH_MODULES = ("params", "metrics")
+
+
+def workflow_runner() -> Union[SandboxedWorkflowRunner, UnsandboxedWorkflowRunner]:
+    if not config.temporal_workflow_sandbox:
+        return UnsandboxedWorkflowRunner()
+    return SandboxedWorkflowRunner(
+        restrictions=SandboxRestrictions.default.with_passthrough_modules(
+            *SANDBOX_PASSTHROUGH_MODULES, *config.temporal_sandbox_passthrough_modules
+        )
+    )
+
+
+@asynccontextmanager
+async def temporal_worker(
+    client: TemporalClient, audio_catalog: Optional[AudioCatalog] = None
+) -> AsyncIterator[List[TemporalWorker]]:
+    """
+    Run one Temporal worker per task queue used by the configured channels. The
+    workers share the activity, the LINE API connection pool and the keyword
+    routers, so each additional channel only costs its API client and router.
+    Audio durations come from `audio_catalog` when the caller already loaded it,
+    otherwise the media directory is catalogued here.
+    """
+    line_api_pool = LineApiPool(
+        pool_size=config.line_api_pool_size,
+        keepalive_timeout=config.line_api_keepalive_timeout,
+        timeout=config.line_api_timeout,
+        connect_timeout=config.line_api_connect_timeout,
+    )
+
+    # Open connections before the worker starts polling, so the first replies
+    # after a deploy or scale-up do not pay for the handshakes.
+    if config.line_api_warmup_connections > 0:
+        await line_api_pool.warm_up(config.line_api_warmup_connections)
+
+    REGISTRY.add_stats_collector(
+        "pingu_line_api_pool", "LINE API connection pool", line_api_pool.stats
+    )
+
+    if audio_catalog is None and config.media_directory is not None:
+        audio_catalog = AudioCatalog(
+            config.media_directory, index_path=config.media_catalog_index_path
+        )
+        await audio_catalog.load()
+    durations = audio_catalog.durations() if audio_catalog is not None else {}
+
+    match_options = MatchOptions(
+        mode=config.keyword_match_mode,
+        priority=config.keyword_match_priority,
+        max_matches=config.keyword_max_matches,
+        max_message_length=config.keyword_max_message_length,
+    )
+    channels = config.channel_settings()
+    reply_channels: Dict[str, ReplyChannel] = {}
+    for channel in channels:
+        rate_limiter = None
+        if channel.rate_limit is not None:
+            rate_limiter = TokenBucket(
+                rate=channel.rate_limit, burst=channel.rate_limit_burst  # type: ignore
+            )
+            REGISTRY.add_stats_collector(
+                "pingu_line_api_rate_limiter",
+                "LINE API rate limiter",
+                rate_limiter.stats,
+                channel=channel.name,
+            )
+        reply_channels[channel.name] = ReplyChannel(
+            line_bot_api=await line_api_pool.messaging_api(
+                channel.channel_access_token
+            ),
+            rate_limiter=rate_limiter,
+        )
+
+        keyword_router = KeywordRouter.from_file(
+            channel.keyword_table_path,  # type: ignore
+            media_base_url=config.media_base_url,
+            durations=durations,
+            match_options=match_options,
+        )
+        install_keyword_router(keyword_router, channel=channel.name)
+        templates = prebuild_reply_templates(
+            [route.reply for route in keyword_router.routes]
+        )
+        logger.info(
+            "Keyword router loaded.",
+            extra={
+                "channel": channel.name,
+                "path": channel.keyword_table_path,
+                "version": keyword_router.version,
+                "keywords": len(keyword_router),
+                "match_mode": match_options.mode,
+                "reply_templates": templates,
+            },
+        )
+
+    reply_activity = ReplyActivity(reply_channels, pool=line_api_pool)
+
+    tuning_options = worker_tuning_options()
+    runner = workflow_runner()
+    task_queues = sorted({channel.task_queue for channel in channels})  # type: ignore
+    workers = [
+        TemporalWorker(
+            client,
+            task_queue=task_queue,
+            workflows=[HandleTextMessageWorkflow, CoalesceTextMessagesWorkflow],
+            activities=[
+                reply_activity.reply_quick_reply,
+                reply_activity.reply_audio,
+                match_keyword_routes,
+            ],
+            workflow_runner=runner,
+            **tuning_options,
+        )
+        for task_queue in task_queues
+    ]
+
+    tasks = [asyncio.create_task(worker.run()) for worker in workers]
+    logger.info(
+        "Temporal worker started.",
+        extra={
+            "task_queues": task_queues,
+            "channels": len(reply_channels),
+            "workflow_sandbox": config.temporal_workflow_sandbox,
+            **tuning_options,
+        },
+    )
+
+    try:
+        yield workers
+    finally:
+        for task in tasks:
+            task.cancel()
+        for worker, task in zip(workers, tasks):
+            try:
+                await task
+            except asyncio.CancelledError:
+                await worker.shutdown()
+        logger.info("Application shutdown: Temporal worker shutdown gracefully.")
+        for name, reply_channel in reply_channels.items():
+            if reply_channel.rate_limiter is not None:
+                logger.info(
+                    "LINE API rate limiter statistics.",
+                    extra={"channel": name, **reply_channel.rate_limiter.stats()},
+                )
+        await line_api_pool.close()
+        logger.debug("Application shutdown: LINE API Client closed.")
+
+
+async def main() -> None:
+    """
+    Run the Temporal worker without the web app, until SIGINT or SIGTERM.
+    """
+    # This process has no web app, so it serves the workflow, activity and pool
+    # metrics it records, and a `/ready` that waits for the workers to poll, on a
+    # listener of its own.
+    startup_timer = StartupTimer()
+    metrics_bridge = temporal_metrics() if config.worker_metrics_port is not None else None
+    with startup_timer.phase("temporal_connect"):
+        client = await TemporalClient.connect(
+            config.temporal_address,
+            namespace=config.temporal_namespace,
+            runtime=metrics_bridge.runtime if metrics_bridge is not None else None,
+        )
+    logger.debug(
+        "Connected to Temporal server.",
+        extra={
+            "address": config.temporal_address,
+            "namespace": config.temporal_namespace,
+        },
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    workers: List[TemporalWorker] = []
+
+    def ready() -> bool:
+        return (
+            bool(workers)
+            and not stop.is_set()
+            and all(worker.is_running for worker in workers)
+        )
+
+    async with AsyncExitStack() as stack:
+        if metrics_bridge is not None:
+            metrics_task = asyncio.create_task(metrics_bridge.run(interval=5.0))
+            stack.callback(metrics_task.cancel)
+            metrics_server = await serve_metrics(
+                REGISTRY,
+                config.web_host,
+                config.worker_metrics_port,  # type: ignore
+                ready=ready,
+            )
+            stack.push_async_callback(metrics_server.wait_closed)
+            stack.callback(metrics_server.close)
+            logger.info(
+                "Serving worker metrics.",
+                extra={"host": config.web_host, "port": config.worker_metrics_port},
+            )
+
+        with startup_timer.phase("worker_setup"):
+            workers = await stack.enter_async_context(temporal_worker(client))
+        logger.info(
+            "Temporal worker startup complete.", extra=startup_timer.summary()
+        )
+        await stop.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,31 @@
+import asyncio
 from datetime import timedelta
-from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 from temporalio import workflow
 from temporalio.common import RetryPolicy
+from temporalio.exceptions import ActivityError
 
+# Keep this module lean: the sandbox re-imports it for every workflow run, so it
+# must not import `config`, `activity` or the LINE SDK. The modules below are
+# also listed in `worker.SANDBOX_PASSTHROUGH_MODULES`. Keyword routes are matched
+# in a local activity, never against the worker's router: a deploy can change
+# the keyword table between a workflow's first task and its replay.
 with workflow.unsafe.imports_passed_through():
-    from activity import (
-        ReplyActivity,
+    from params import (
+        MATCH_KEYWORD_ROUTES_ACTIVITY,
+        REPLY_AUDIO_ACTIVITY,
+        REPLY_QUICK_REPLY_ACTIVITY,
+        MatchKeywordRoutesActivityParams,
         ReplyQuickReplyActivityParams,
         ReplyAudioActivityParams,
+        RouteMatch,
     )
-    from linebot.v3.messaging.exceptions import ApiException
+    from metrics import WORKFLOW_END_TO_END_SECONDS, WORKFLOW_KEYWORD_MATCHES
+
+# The name of `linebot.v3.messaging.exceptions.ApiException`, which is not
+# imported here to keep the SDK out of the sandbox.
+API_EXCEPTION_TYPE = "ApiException"
 
 
 @dataclass
@@ -17,123 +33,285 @@ class HandleTextMessageWorkflowParams:
     reply_token: str
     quote_token: str
     message: str
+    use_local_activities: bool = False
+    channel: str = ""
+
+
+async def _execute_reply(activity: str, params: Any, use_local_activity: bool) -> dict:
+    retry_policy = RetryPolicy(
+        maximum_attempts=3,
+        maximum_interval=timedelta(seconds=5),
+        non_retryable_error_types=[API_EXCEPTION_TYPE],
+    )
+
+    # A local activity runs in the worker that owns the workflow task, which
+    # skips the schedule -> poll -> complete round-trips through the server.
+    if use_local_activity:
+        return await workflow.execute_local_activity(
+            activity,
+            params,
+            result_type=dict,
+            start_to_close_timeout=timedelta(seconds=5),
+            retry_policy=retry_policy,
+        )
+
+    return await workflow.execute_activity(
+        activity,
+        params,
+        result_type=dict,
+        start_to_close_timeout=timedelta(seconds=5),
+        retry_policy=retry_policy,
+    )
+
+
+def _record_match(route: str | None) -> None:
+    # The metric meter is replay-aware, so this is only recorded once.
+    workflow.metric_meter().create_counter(
+        WORKFLOW_KEYWORD_MATCHES, "Text messages by matched keyword route."
+    ).add(
+        1,
+        {
+            "matched": "true" if route is not None else "false",
+            "route": route if route is not None else "",
+        },
+    )
+
+
+async def _match_routes(channel: str, messages: List[str]) -> List[Optional[RouteMatch]]:
+    # The matches are recorded in the history and replayed from there, so a
+    # workflow keeps acting on the keyword table it started with.
+    return await workflow.execute_local_activity(
+        MATCH_KEYWORD_ROUTES_ACTIVITY,
+        MatchKeywordRoutesActivityParams(channel=channel, messages=messages),
+        result_type=List[Optional[RouteMatch]],
+        start_to_close_timeout=timedelta(seconds=5),
+        retry_policy=RetryPolicy(maximum_attempts=3, maximum_interval=timedelta(seconds=5)),
+    )
+
+
+async def _reply_with(
+    route: RouteMatch,
+    reply_token: str,
+    quote_token: str,
+    channel: str,
+    use_local_activity: bool,
+) -> bool:
+    if route.content_url is not None:
+        await _execute_reply(
+            REPLY_AUDIO_ACTIVITY,
+            ReplyAudioActivityParams(
+                reply_token=reply_token,
+                content_url=route.content_url,
+                duration=route.duration or 0,
+                channel=channel,
+            ),
+            use_local_activity,
+        )
+        return True
+
+    await _execute_reply(
+        REPLY_QUICK_REPLY_ACTIVITY,
+        ReplyQuickReplyActivityParams(
+            reply_token=reply_token,
+            quote_token=quote_token,
+            message=route.message or "",
+            quick_messages=route.options,
+            channel=channel,
+        ),
+        use_local_activity,
+    )
+    return True
 
 
 @workflow.defn(name="HandleTextMessage")
 class HandleTextMessageWorkflow:
     @workflow.run
     async def run(self, input: HandleTextMessageWorkflowParams) -> bool:
-        retry_policy = RetryPolicy(
-            maximum_attempts=3,
-            maximum_interval=timedelta(seconds=5),
-            non_retryable_error_types=[ApiException.__name__],
+        replied = await self._handle(input)
+        workflow.metric_meter().create_histogram_timedelta(
+            WORKFLOW_END_TO_END_SECONDS,
+            "Time from workflow start to completion.",
+            unit="s",
+        ).record(workflow.now() - workflow.info().workflow_start_time)
+        return replied
+
+    async def _handle(self, input: HandleTextMessageWorkflowParams) -> bool:
+        [route] = await _match_routes(input.channel, [input.message])
+        _record_match(route.route if route is not None else None)
+        if route is None:
+            return False
+
+        workflow.logger.debug(
+            "Matched keyword route.",
+            extra={"route": route.route, "channel": input.channel},
+        )
+        return await _reply_with(
+            route,
+            input.reply_token,
+            input.quote_token,
+            input.channel,
+            input.use_local_activities,
         )
 
-        match input.message.strip().lower().replace(" ", ""):
-            case text if any([keyword == text for keyword in ["pingu"]]):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_quick_reply,  # type: ignore
-                    ReplyQuickReplyActivityParams(
-                        reply_token=input.reply_token,
-                        quote_token=input.quote_token,
-                        message="想讓 Pingu 怎麼叫 ?",
-                        quick_messages=[
-                            "叫",
-                            "驚訝",
-                            "生氣",
-                            "天婦羅",
-                            "甜甜圈",
-                            "雞排",
-                        ],
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
-                )
-                return True
 
-            case text if any(
-                [keyword == text for keyword in ["叫", "noot", "noot noot"]]
-            ):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/noot_noot.mp3",
-                        duration=1000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
-                )
-                return True
-
-            case text if any([keyword == text for keyword in ["驚訝", "驚"]]):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/amazed.mp3",
-                        duration=1000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
-                )
-                return True
-
-            case text if any([keyword == text for keyword in ["生氣", "氣"]]):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/sms.mp3",
-                        duration=4000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
+@dataclass
+class SourceTextMessage:
+    webhook_event_id: str
+    reply_token: str
+    quote_token: str
+    message: str
+
+
+@dataclass
+class CoalesceOptions:
+    # How long a burst is collected after its first message, in seconds. Replies
+    # are delayed by up to this much, and LINE reply tokens expire after a minute.
+    window_seconds: float = 1.0
+    # The most replies sent for one burst.
+    max_replies_per_window: int = 3
+    # Continue as new after this many messages, to keep the history small.
+    max_messages_per_run: int = 500
+    # Complete after this long without messages; the next message starts a new run.
+    idle_timeout_seconds: float = 300.0
+
+
+@dataclass
+class CoalesceTextMessagesWorkflowParams:
+    channel: str
+    source: str
+    options: CoalesceOptions = field(default_factory=CoalesceOptions)
+    use_local_activities: bool = False
+    # Messages received but not handled yet when the previous run continued as new.
+    pending: List[SourceTextMessage] = field(default_factory=list)
+
+
+@workflow.defn(name="CoalesceTextMessages")
+class CoalesceTextMessagesWorkflow:
+    """
+    Handles every text message of one LINE source (a user, group or room) of a
+    channel. Messages arrive as signals through signal-with-start, so a flood costs
+    one history event per message instead of one workflow per message. Messages
+    are collected for `window_seconds` after the first one; of each burst, only
+    the most recent message per matched route is answered, up to
+    `max_replies_per_window` replies.
+    """
+
+    def __init__(self) -> None:
+        self._pending: List[SourceTextMessage] = []
+        self._received = 0
+
+    @workflow.signal(name="message")
+    def message(self, message: SourceTextMessage) -> None:
+        self._pending.append(message)
+        self._received += 1
+
+    @workflow.run
+    async def run(self, input: CoalesceTextMessagesWorkflowParams) -> int:
+        self._pending = input.pending + self._pending
+        options = input.options
+        replied = 0
+        while True:
+            try:
+                await workflow.wait_condition(
+                    lambda: bool(self._pending), timeout=options.idle_timeout_seconds
                 )
-                return True
+            except asyncio.TimeoutError:
+                # A signal can arrive in the same workflow task as the idle timer;
+                # only complete when nothing is left to answer.
+                if not self._pending:
+                    return replied
+
+            await workflow.sleep(options.window_seconds)
+            burst, self._pending = self._pending, []
+            replied += await self._handle_burst(input, burst)
 
-            case text if any(
-                [keyword == text for keyword in ["天婦羅", "乾", "幹", "幹你娘"]]
+            if (
+                self._received >= options.max_messages_per_run
+                or workflow.info().is_continue_as_new_suggested()
             ):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/oh_fucking.mp3",
-                        duration=4000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
+                await workflow.wait_condition(workflow.all_handlers_finished)
+                workflow.continue_as_new(
+                    CoalesceTextMessagesWorkflowParams(
+                        channel=input.channel,
+                        source=input.source,
+                        options=options,
+                        use_local_activities=input.use_local_activities,
+                        pending=self._pending,
+                    )
                 )
-                return True
-
-            case text if any([keyword == text for keyword in ["甜甜圈"]]):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/donut.mp3",
-                        duration=4000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
+
+    async def _handle_burst(
+        self, input: CoalesceTextMessagesWorkflowParams, burst: List[SourceTextMessage]
+    ) -> int:
+        # LINE redelivers events whose webhook failed.
+        unique: Dict[str, SourceTextMessage] = {}
+        for message in burst:
+            unique.setdefault(message.webhook_event_id, message)
+        messages = list(unique.values())
+
+        try:
+            matches = await _match_routes(
+                input.channel, [message.message for message in messages]
+            )
+        except ActivityError:
+            # Failing would end the workflow of the whole source; drop this burst.
+            workflow.logger.warning(
+                "Failed to match keyword routes, skipped burst of text messages.",
+                extra={
+                    "channel": input.channel,
+                    "source": input.source,
+                    "messages": len(messages),
+                },
+            )
+            return 0
+
+        # The most recent message per route wins: it has the freshest reply token.
+        latest: Dict[str, Tuple[RouteMatch, SourceTextMessage]] = {}
+        for message, route in zip(messages, matches):
+            _record_match(route.route if route is not None else None)
+            if route is not None:
+                latest.pop(route.route, None)
+                latest[route.route] = (route, message)
+
+        replies = list(latest.values())[-input.options.max_replies_per_window :]
+        results = await asyncio.gather(
+            *(
+                _reply_with(
+                    route,
+                    message.reply_token,
+                    message.quote_token,
+                    input.channel,
+                    input.use_local_activities,
                 )
-                return True
+                for route, message in replies
+            ),
+            return_exceptions=True,
+        )
 
-            case text if any(
-                [keyword == text for keyword in ["雞排", "機掰", "雞巴", "雞掰"]]
-            ):
-                await workflow.execute_activity(
-                    ReplyActivity.reply_audio,  # type: ignore
-                    ReplyAudioActivityParams(
-                        reply_token=input.reply_token,
-                        content_url="https://folio.weii.cloud/files/audio/pingu/jiba.mp3",
-                        duration=2000,
-                    ),
-                    start_to_close_timeout=timedelta(seconds=5),
-                    retry_policy=retry_policy,
+        replied = 0
+        for (route, message), result in zip(replies, results):
+            if isinstance(result, ActivityError):
+                # One failed reply must not end the workflow of the whole source.
+                workflow.logger.warning(
+                    "Failed to reply to text message.",
+                    extra={
+                        "route": route.route,
+                        "channel": input.channel,
+                        "webhook_event_id": message.webhook_event_id,
+                    },
                 )
-                return True
+            elif isinstance(result, BaseException):
+                raise result
+            elif result:
+                replied += 1
 
-            case _:
-                return False
+        workflow.logger.debug(
+            "Handled burst of text messages.",
+            extra={
+                "channel": input.channel,
+                "source": input.source,
+                "messages": len(burst),
+                "replies": replied,
+            },
+        )
+        return replied